@@ -1,5 +1,12 @@
 from manimcoder.programcode import *
 from manimcoder.codedisplay import *
 from manimcoder.scriptscene import *
+from manimcoder.glyphcache import *
+from manimcoder.themes import *
+from manimcoder.tracelog import *
+from manimcoder.tracer import *
+from manimcoder.layout import *
+from manimcoder.profiler import *
+from manimcoder.cachekey import *
 
-__all__ = ['ProgramCode', 'HighlightedCode', 'CodeDisplay', 'CodeDisplayWindow', 'CodeDisplayWindowColumn', 'PANEL_CODE', 'PANEL_VARS', 'PANEL_TRACE', 'PANEL_OUTPUT', 'ScriptScene']
+__all__ = ['ProgramCode', 'HighlightedCode', 'CodeDisplay', 'CodeDisplayWindow', 'CodeDisplayWindowColumn', 'PANEL_CODE', 'PANEL_VARS', 'PANEL_TRACE', 'PANEL_OUTPUT', 'ScriptScene', 'GlyphCache', 'glyph_cache', 'Theme', 'register_theme', 'get_theme', 'ProgramTracer', 'TraceEvents', 'TraceLog', 'read_trace', 'trace_program', 'PanelLayoutTransition', 'Constraint', 'PanelLayout', 'RenderProfiler', 'profiler', 'ScriptSceneFileWriter']
@@ -0,0 +1,17 @@
+from contextlib import contextmanager
+import os
+import tempfile
+
+
+@contextmanager
+def atomic_path(path):
+    # A temporary file next to path, renamed over it once written. Every writer gets a file of its own, so parallel
+    # renders saving the same cache entry never write into each other's.
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        yield temp
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
@@ -0,0 +1,136 @@
+from manim import *
+from enum import Enum
+from types import BuiltinFunctionType, CodeType, FunctionType, MethodType
+import hashlib
+import numpy as np
+
+# Cache keys for play() calls that only depend on what is drawn, so the same animation gets the same key on every
+# render. manim's own hash takes in object ids and whatever attributes happen to be set, and changes between runs.
+
+MOBJECT_ARRAYS = ['points', 'fill_rgbas', 'stroke_rgbas', 'background_stroke_rgbas', 'pixel_array']
+MOBJECT_VALUES = ['stroke_width', 'background_stroke_width', 'z_index']
+SKIPPED_ANIMATION_ATTRIBUTES = {'starting_mobject', 'group', 'anims_with_timings'}
+
+
+class CacheKey:
+    def __init__(self):
+        self.hash = hashlib.sha256()
+        self.seen = set()
+
+    def update(self, *values):
+        for value in values:
+            self.value(value)
+        return self
+
+    def text(self, text):
+        self.hash.update(text.encode())
+        self.hash.update(b'\0')
+
+    def array(self, array):
+        array = np.ascontiguousarray(array)
+        self.text(f'{array.dtype}{array.shape}')
+        self.hash.update(array.tobytes())
+
+    def value(self, value):
+        if value is None or isinstance(value, (bool, int, float, str, Enum)):
+            self.text(repr(value))
+        elif isinstance(value, np.ndarray):
+            self.array(value)
+        elif isinstance(value, (list, tuple)):
+            self.text(f'{type(value).__name__}{len(value)}')
+            for item in value:
+                self.value(item)
+        elif isinstance(value, dict):
+            self.text(f'dict{len(value)}')
+            for key in sorted(value, key=repr):
+                self.value(key)
+                self.value(value[key])
+        elif id(value) in self.seen:
+            self.text(f'seen {type(value).__name__}')
+        else:
+            self.seen.add(id(value))
+            self.object(value)
+
+    def object(self, value):
+        if isinstance(value, Mobject):
+            self.mobject(value)
+        elif isinstance(value, Animation):
+            self.animation(value)
+        elif isinstance(value, MethodType):
+            self.text(value.__func__.__qualname__)
+            self.value(value.__self__)
+        elif isinstance(value, FunctionType):
+            self.text(value.__qualname__)
+            self.code(value.__code__)
+            self.value(value.__defaults__)
+            for cell in value.__closure__ or []:
+                self.value(cell.cell_contents)
+        elif isinstance(value, (BuiltinFunctionType, type)):
+            self.text(value.__qualname__)
+        elif hasattr(value, '__dict__'):
+            self.text(type(value).__qualname__)
+            self.value(vars(value))
+        else:
+            self.text(type(value).__qualname__)
+
+    def code(self, code):
+        self.hash.update(code.co_code)
+        for const in code.co_consts:
+            if isinstance(const, CodeType):
+                self.code(const)
+            else:
+                self.value(const)
+
+    def mobject(self, mobject):
+        # Only what is drawn, not the class, so glyphs loaded from the glyph cache key the same as fresh ones
+        for member in mobject.get_family():
+            for name in MOBJECT_ARRAYS:
+                if hasattr(member, name):
+                    self.array(getattr(member, name))
+            self.value([getattr(member, name, None) for name in MOBJECT_VALUES])
+
+    def animation(self, animation):
+        self.text(type(animation).__name__)
+        self.value([animation.run_time, animation.lag_ratio, animation.rate_func])
+        cache_key = getattr(animation, 'cache_key', None)
+        if cache_key is not None: # the animation knows what it will draw
+            self.text(cache_key)
+        elif isinstance(animation, AnimationGroup):
+            self.value(animation.animations)
+        else:
+            self.value({name: value for name, value in vars(animation).items() if name not in SKIPPED_ANIMATION_ATTRIBUTES})
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+def play_cache_key(scene):
+    key = CacheKey()
+    key.update(
+        [config.pixel_width, config.pixel_height, config.frame_rate, config.frame_width, str(config.background_color)],
+        scene.camera.frame_center if hasattr(scene.camera, 'frame_center') else None,
+    )
+    key.update(scene.animations) # each animation's mobjects are hashed as part of it
+    animated = {
+        id(member) for animation in scene.animations if getattr(animation, 'mobject', None) is not None
+        for member in animation.mobject.get_family()
+    }
+    for mobject in scene.mobjects:
+        if id(mobject) not in animated:
+            key.mobject(mobject)
+    return 'mc_' + key.hexdigest()[:40]
+
+
+class ScriptSceneFileWriter(SceneFileWriter):
+    # Names partial movie files by the key of the play being rendered, set by ScriptScene, instead of manim's hash
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_key = None
+
+    def is_already_cached(self, hash_invocation):
+        return super().is_already_cached(self.cache_key or hash_invocation)
+
+    def add_partial_movie_file(self, hash_animation):
+        if hash_animation is not None and self.cache_key is not None and not config.disable_caching:
+            hash_animation = self.cache_key
+        super().add_partial_movie_file(hash_animation)
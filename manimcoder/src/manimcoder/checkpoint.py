@@ -0,0 +1,99 @@
+from manim import *
+from manimcoder.atomicfile import atomic_path
+import glob
+import hashlib
+import inspect
+import json
+import manim
+import os
+
+
+def state_digest(state):
+    return hashlib.sha256(json.dumps(state, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def environment_digest():
+    # The manim version and every manimcoder source file, so upgrading either invalidates every checkpoint
+    digest = hashlib.sha256(manim.__version__.encode())
+    package = os.path.dirname(os.path.abspath(__file__))
+    for path in sorted(glob.glob(os.path.join(package, '**', '*.py'), recursive=True)):
+        digest.update(os.path.relpath(path, package).encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def scene_source_lines(scene_class):
+    # The scene's module, less every other scene in it, so editing one scene leaves the others' checkpoints valid, and
+    # the (start, end) lines of the scene
+    path = os.path.abspath(inspect.getsourcefile(scene_class))
+    with open(path) as f:
+        lines = f.readlines()
+    module = inspect.getmodule(scene_class)
+    for cls in vars(module).values():
+        if inspect.isclass(cls) and issubclass(cls, Scene) and cls is not scene_class and cls.__module__ == module.__name__:
+            source, start = inspect.getsourcelines(cls)
+            lines[start - 1:start - 1 + len(source)] = [''] * len(source)
+    source, start = inspect.getsourcelines(scene_class)
+    return path, lines, (start - 1, start - 1 + len(source))
+
+
+class SceneCheckpoints:
+    # A checkpoint is taken at every script() call: the line it was called from, a hash of the scene's code up to that
+    # line, a digest of what is on screen, and the partial movie files of the section it starts. On the next render a
+    # section whose code and starting state are unchanged is fast-forwarded, and its movie files reused.
+    # The hash also covers the rest of the module outside the scene, since the scene may call helpers defined anywhere
+    # in it, and the manim version and manimcoder sources.
+    def __init__(self, scene_class, path):
+        self.path = path
+        self.source_path, self.lines, self.scene_lines = scene_source_lines(scene_class)
+        start, end = self.scene_lines
+        self.context = environment_digest() + ''.join(self.lines[:start] + self.lines[end:])
+        self.previous = self.load()
+        self.checkpoints = []
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as f:
+            return json.load(f)
+
+    def save(self):
+        with atomic_path(self.path) as path, open(path, 'w') as f:
+            json.dump(self.checkpoints, f)
+
+    def key(self, line):
+        return hashlib.sha256((self.context + ''.join(self.lines[self.scene_lines[0]:line])).encode()).hexdigest()
+
+    def caller_line(self):
+        frame = inspect.currentframe()
+        while frame is not None and os.path.abspath(frame.f_code.co_filename) != self.source_path:
+            frame = frame.f_back
+        return frame.f_lineno if frame is not None else len(self.lines)
+
+    def reached(self, play, time, state, line=None):
+        # Records a checkpoint, and returns (checkpoint, next checkpoint) of the previous render if the section starting
+        # here can be reused
+        line = self.caller_line() if line is None else line
+        index = len(self.checkpoints)
+        checkpoint = {'line': line, 'key': self.key(line), 'play': play, 'time': time, 'state': state_digest(state), 'movies': []}
+        self.checkpoints.append(checkpoint)
+        if index + 1 >= len(self.previous):
+            return None
+        old, following = self.previous[index], self.previous[index + 1]
+        if old['key'] != checkpoint['key'] or old['state'] != checkpoint['state'] or old['play'] != play:
+            return None
+        if following['key'] != self.key(following['line']):
+            return None
+        if not all(os.path.exists(movie) for movie in old['movies']):
+            return None
+        return old, following
+
+    def end_section(self, partial_movie_files):
+        if self.checkpoints:
+            self.checkpoints[-1]['movies'] = partial_movie_files[self.checkpoints[-1]['play']:]
+
+    def finish(self, play, time, state, partial_movie_files):
+        self.end_section(partial_movie_files)
+        self.reached(play, time, state, line=len(self.lines))
+        self.save()
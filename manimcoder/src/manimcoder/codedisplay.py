@@ -1,12 +1,11 @@
 from manim import *
 from manimcoder.programcode import *
-from pygments import highlight
-from pygments.formatters.html import HtmlFormatter
+from manimcoder.tracer import trace_program, replay_trace
+from manimcoder.layout import Constraint, PanelLayout
 from pygments.lexers import get_lexer_by_name, guess_lexer_for_filename
 from pygments.styles import get_all_styles
-import bs4
 from enum import Enum
-from collections import namedtuple, defaultdict
+from collections import namedtuple, defaultdict, deque
 from typing import (
     TYPE_CHECKING,
     Callable,
@@ -33,6 +32,7 @@ PANEL_OUTPUT = 4
 class CodeDisplayWindow(VGroup):
     title_text = 'NoTitle'
     content_class = Text
+    content_offset = DOWN*0.15 + RIGHT*PANEL_PADDING # from the bottom left of the title bar
     def __init__(self, title_text=None):
         super().__init__()
         if title_text: self.title_text = title_text
@@ -40,12 +40,15 @@ class CodeDisplayWindow(VGroup):
         self.title_bar = Rectangle(width=CANVAS_SIZE[0] - PANEL_PADDING, height=0.4).flip()
         self.title_bar.set_stroke(width=0)
         self.title_bar.set_fill(opacity=0.1)
-        self.title_bar.align_to(self.rectangle, UP+LEFT)
-        self.title_bar.add_updater(lambda d: d.align_to(self.rectangle, UP+LEFT))
         self.title = Text(self.title_text).scale(0.5)
-        self.title.move_to(self.title_bar.get_center())
-        self.title.add_updater(lambda d: d.move_to(self.title_bar.get_center()))
         self.content = self.generate_content()
+        self.layout = PanelLayout().add(
+            Constraint(self.title_bar, self.rectangle, UP+LEFT, anchor=UP+LEFT),
+            Constraint(self.title, self.title_bar),
+        )
+        if self.content:
+            self.layout.add(Constraint(self.content, self.title_bar, DOWN+LEFT, self.content_offset, anchor=UP+LEFT))
+        self.layout.update()
         self.add(self.title_bar)
         self.add(self.rectangle)
 
@@ -54,25 +57,43 @@ class CodeDisplayWindow(VGroup):
             content = self.content_class('TEST', *args, **kwargs).scale(0.5)
         else:
             content = self.content_class(*args, **kwargs)
-        content.next_to(self.title_bar, DOWN).align_to(self.title_bar, LEFT).shift((UP+RIGHT)*0.1)
-        content.add_updater(lambda d: d.next_to(self.title_bar, DOWN).align_to(self.title_bar, LEFT).shift((UP+RIGHT)*0.1))
         return content
 
+    def update_layout(self):
+        self.layout.mark_dirty()
+        self.layout.update()
+        return self
+
+    def shift(self, *vectors):
+        # title and content only become submobjects once created, so they are placed by the layout, not shifted
+        super().shift(*vectors)
+        return self.update_layout()
+
     def set_height(self, height):
         self.rectangle.stretch_to_fit_height(height, about_edge=UP)
+        return self.update_layout()
 
     def stretch_to_fit_width(self, *args, **kwargs):
         self.rectangle.stretch_to_fit_width(*args, **kwargs)
         self.title_bar.stretch_to_fit_width(*args, **kwargs)
+        return self.update_layout()
 
     def content_create_animation(self, **anim_args):
         return [Create(self.content, **anim_args)]
 
+    def checkpoint_state(self):
+        return {
+            'title': self.title_text,
+            'corner': self.rectangle.get_corner(UP+LEFT).round(3).tolist(),
+            'size': [round(self.rectangle.width, 3), round(self.rectangle.height, 3)],
+        }
+
     def content_uncreate_animation(self, **anim_args):
         return [Uncreate(self.content, **anim_args)]
 
     @override_animation(Create)
     def _create_override(self, **anim_args):
+        self.update_layout() # catch up with any moves of an enclosing column made before the title and content were added
         self.add(self.title)
         if self.content:
             self.add(self.content)
@@ -112,7 +133,9 @@ class CodeDisplayWindow(VGroup):
 
 class ProgramCodeCodeDisplayWindow(CodeDisplayWindow):
     content_class = ProgramCode
+    content_offset = (DOWN+RIGHT)*PANEL_PADDING
     lexer = 'python'
+    detect_moves = False
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.oldrunarrorw = None
@@ -127,15 +150,20 @@ class ProgramCodeCodeDisplayWindow(CodeDisplayWindow):
     def content_uncreate_animation(self, **anim_args):
         # TODO: include arrow
         return [
-            Uncreate(self.content.all_text, **anim_args),  # TODO: Hack
             Uncreate(self.content, **anim_args),
        ]
 
     def generate_content(self):
-        content = self.content_class('', lexer=self.lexer)
-        content.align_to(self.title_bar, DOWN+LEFT).shift((DOWN+RIGHT)*0.1)
-        content.add_updater(lambda d: d.align_to(self.title_bar, DOWN+LEFT).shift((DOWN+RIGHT)*0.1))
-        return content
+        return self.content_class('', lexer=self.lexer, detect_moves=self.detect_moves)
+
+    def changes(self):
+        return self.content.changes()
+
+    def checkpoint_state(self):
+        state = super().checkpoint_state()
+        state['code'] = self.content.code.get_new_code()
+        state['runarrow'] = None if self.newrunarrow is None else self.newrunarrow.get_start().round(3).tolist()
+        return state
 
     def update_runarrow(self, obj):
         self.oldrunarrow = self.newrunarrow
@@ -166,114 +194,131 @@ class ProgramCodeCodeDisplayWindow(CodeDisplayWindow):
 
 class CodePanel(ProgramCodeCodeDisplayWindow):
     title_text = 'program.py'
-    def generate_content(self):
-        content = self.content_class('', lexer=self.lexer)
-        content.align_to(self.title_bar, DOWN+LEFT).shift(DOWN*0.1+RIGHT*0.5)
-        content.add_updater(lambda d: d.align_to(self.title_bar, DOWN+LEFT).shift(DOWN*0.1+RIGHT*0.5))
-        return content
+    detect_moves = True # reordered code slides into place, unlike scrolling output or popped variables
+    content_offset = DOWN*PANEL_PADDING + RIGHT*0.5 # room for the run arrow
+
+
+class VarsFrame:
+    def __init__(self, name, depth, heading=None, bar=None):
+        self.name = name
+        self.depth = depth
+        self.heading = heading # ProgramCodeLine, None for the global frame
+        self.heading_index = None # where heading is in the panel's lines, kept up to date by VarsPanel
+        self.bar = bar
+        self.vars = {}
+        self.lines = {}
 
 
 class VarsPanel(ProgramCodeCodeDisplayWindow):
     title_text = 'Variables'
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.scopes = {'': {}}
-        self.current_scope = ''
+        self.frames = [VarsFrame('', 0)]
+        self.frames_by_name = defaultdict(list) # the same function may have several frames on the stack
+        self.frames_by_name[''].append(self.frames[0])
         self.var_length = 5
-        self.scope_bars = {}
         self.changes_queue = []
+        self.dirty_frames = {} # frames whose scope bar needs to be laid out again, in insertion order
 
-    def get_lines(self):
-        lines = {}
-        scope = ''
-        for lineno, line in enumerate(self.content.code.get_new_code().split('\n')):
-            if line == '': continue
-            if '=' in line:
-                line = line.split('=')[0].strip()
-                lines[(scope, line)] = lineno
-            else:
-                scope = line
-                lines[(scope, '')] = lineno
-        return lines
+    @property
+    def current_scope(self):
+        return self.frames[-1].name
+
+    def get_frame(self, scope=None):
+        if scope is None:
+            return self.frames[-1]
+        if isinstance(scope, VarsFrame):
+            return scope
+        return self.frames_by_name[scope][-1]
 
     def get_next_scope_line(self, scope):
-        found_scope = scope == ''
-        for (s, v), lineno in self.get_lines().items():
-            print(found_scope, s, v, lineno)
-            if s==scope and v=='':
-                found_scope = True
-            if found_scope and v=='':
-                return lineno
-        return lineno
+        frame = self.get_frame(scope)
+        if frame.depth + 1 == len(self.frames):
+            return len(self.content.code.lines)
+        return self.frames[frame.depth + 1].heading_index
 
     def last_scope_name(self):
-        scope = ''
-        for (s, v), lineno in self.get_lines().items():
-            if v=='':
-                scope = s
-        return scope
+        return self.current_scope
+
+    def mark_frames_above_dirty(self, frame):
+        # lines added or removed inside a frame move every frame above it
+        for above in self.frames[frame.depth + 1:]:
+            self.dirty_frames[above] = True
 
     def set_var(self, varname, value, scope=None):
         if len(varname) > self.var_length:
             raise Exception(f"Var {varname} longer than var_length={self.var_length}.")
-        if scope is None:
-            scope = self.current_scope
-        if varname not in self.scopes[scope]:
-            self.scopes[scope][varname] = value
+        frame = self.get_frame(scope)
+        if varname not in frame.vars:
             line = varname + ' ' * (self.var_length - len(varname))
             line = f"{line} = {value}"
-            if scope == self.current_scope:
-                self.content.append_line(line)
+            if frame is self.frames[-1]:
+                frame.lines[varname] = self.content.append_line(line)
             else:
-                self.content.insert_line(self.get_next_scope_line(scope), line)
+                frame.lines[varname] = self.content.insert_line(self.get_next_scope_line(frame), line)
+                for above in self.frames[frame.depth + 1:]:
+                    above.heading_index += 1
+                self.mark_frames_above_dirty(frame)
         else:
-            self.content.replace(self.get_lines()[(scope, varname)], self.scopes[scope][varname], value)
-            self.scopes[scope][varname] = value
+            # the value is the end of the line, and a search could match the name instead
+            code = frame.lines[varname].get_new_code()
+            frame.lines[varname].splice(len(code) - len(frame.vars[varname]), len(code), value)
+        frame.vars[varname] = value
 
     def remove_var(self, varname, scope=None):
-        if scope is None:
-            scope = self.current_scope
-        self.content.remove_line(self.get_lines()[(scope, varname)])
-        del self.scopes[scope][varname]
+        frame = self.get_frame(scope)
+        frame.lines.pop(varname).delete = True
+        del frame.vars[varname]
+        self.mark_frames_above_dirty(frame)
 
     def add_scope(self, scope):
-        self.scopes[scope] = {}
-        self.content.append_line(scope)
-        self.current_scope = scope
         bar = Rectangle(height=0.625*self.content.text_scale, width=self.rectangle.width)
         bar.set_stroke(width=0)
         bar.set_fill(opacity=0.2)
-        self.scope_bars[scope] = bar
+        heading_index = len(self.content.code.lines)
+        frame = VarsFrame(scope, len(self.frames), self.content.append_line(scope), bar)
+        frame.heading_index = heading_index
+        self.frames.append(frame)
+        self.frames_by_name[scope].append(frame)
+        self.dirty_frames[frame] = True
         self.add(bar)
         self.changes_queue.append(Create(bar))
+        return frame
 
     def remove_scope(self):
-        scope = self.current_scope
-        del self.scopes[scope]
-        for (s, _), lineno in self.get_lines().items():
-            if s == scope:
-                self.content.remove_line(lineno)
-        self.current_scope = self.last_scope_name()
-        self.changes_queue.append(FadeOut(self.scope_bars[scope]))
-        del self.scope_bars[scope]
+        frame = self.frames.pop()
+        self.frames_by_name[frame.name].pop()
+        frame.heading.delete = True
+        for line in frame.lines.values():
+            line.delete = True
+        self.changes_queue.append(FadeOut(frame.bar))
+        return frame
+
+    def checkpoint_state(self):
+        state = super().checkpoint_state()
+        state['frames'] = [[frame.name, frame.vars] for frame in self.frames]
+        state['var_length'] = self.var_length
+        return state
 
     def symbols_line(self, varname, scope=None):
-        if scope is None:
-            scope = self.current_scope
-        return self.content.code.lines[self.get_lines()[(scope, varname)]].symbols
+        frame = self.get_frame(scope)
+        if varname == '':
+            return frame.heading.symbols
+        return frame.lines[varname].symbols
 
     def symbols_value(self, varname, scope=None):
-        if scope is None:
-            scope = self.current_scope
-        return self.content.code.lines[self.get_lines()[(scope, varname)]].symbols[len(varname)+1:]
+        return self.get_frame(scope).lines[varname].symbols[len(varname)+1:]
 
     def changes(self):
         changes = self.content.changes()
-
+        for frame in self.frames[1:]: # deleted lines have just been dropped from the panel's lines
+            frame.heading_index = frame.heading.row
+        for frame in self.dirty_frames:
+            if frame.depth < len(self.frames) and self.frames[frame.depth] is frame:
+                frame.bar.move_to(frame.heading.symbols)
+                frame.bar.align_to(self.rectangle, LEFT)
+        self.dirty_frames = {}
         if self.changes_queue:
-            for scope, bar in self.scope_bars.items():
-                bar.move_to(self.symbols_line('', scope=scope))
-                bar.align_to(self.rectangle, LEFT)
             changes = AnimationGroup(
                 *self.changes_queue,
                 changes
@@ -286,21 +331,32 @@ class OutputPanel(ProgramCodeCodeDisplayWindow):
     title_text = 'Output'
     lexer = 'text'
     max_lines = 4
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.output_lines = deque(self.content.code.lines) # visible lines, oldest first
+
     def add_line(self, text):
-        self.content.append_line(text)
-        while len(self.content.code.get_new_code().split('\n')) > self.max_lines:
-            for line in self.content.code.lines:
-                if not line.delete:
-                    line.delete = True
-                    break
+        while len(self.output_lines) >= self.max_lines:
+            self.output_lines.popleft().delete = True # scrolls off the top on the next changes()
+        self.output_lines.append(self.content.append_line(text))
 
     def clear_lines(self):
         self.content.remove_all_lines()
+        self.output_lines.clear()
 
 
-class TracePanel(CodeDisplayWindow):
+class TracePanel(ProgramCodeCodeDisplayWindow):
     title_text = 'Stack'
     lexer = 'text'
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.frame_lines = []
+
+    def push_frame(self, text):
+        self.frame_lines.append(self.content.append_line(text))
+
+    def pop_frame(self):
+        self.frame_lines.pop().delete = True
 
 
 class CodeDisplayWindowColumn(VGroup):
@@ -378,6 +434,49 @@ class SideCodeDisplayWindowColumn(CodeDisplayWindowColumn):
     bottom_panel_class = TracePanel
 
 
+class PanelLayoutTransition(Animation):
+    # Animates a display to the panel layout left by apply(display), e.g. set_panels. The end geometry is worked out once
+    # in begin, and only the rectangles and title bars are interpolated. Titles, content and anything else in a window
+    # follow along, and are only moved when their anchor moves.
+    def __init__(self, display, apply, **kwargs):
+        self.apply = apply
+        self.windows = display.windows()
+        super().__init__(display, **kwargs)
+
+    def geometry(self):
+        return [(window.rectangle.points.copy(), window.title_bar.points.copy()) for window in self.windows]
+
+    def set_geometry(self, geometry):
+        for window, (rectangle, title_bar) in zip(self.windows, geometry):
+            corner = window.rectangle.get_corner(UP+LEFT)
+            window.rectangle.points = rectangle
+            window.title_bar.points = title_bar
+            shift = window.rectangle.get_corner(UP+LEFT) - corner
+            if np.any(shift):
+                # e.g. VarsPanel scope bars, which are not part of the window layout
+                for mobject in window.submobjects:
+                    if mobject not in (window.rectangle, window.title_bar, window.title, window.content):
+                        mobject.shift(shift)
+            window.update_layout()
+
+    def begin(self):
+        self.start = self.geometry()
+        self.apply(self.mobject)
+        self.end = self.geometry()
+        self.set_geometry(self.start)
+        super().begin()
+
+    def create_starting_mobject(self):
+        return self.mobject # the start geometry is all that is needed, no need to copy every glyph
+
+    def interpolate_mobject(self, alpha):
+        alpha = self.rate_func(alpha)
+        self.set_geometry([
+            (interpolate(rectangle0, rectangle1, alpha), interpolate(title_bar0, title_bar1, alpha))
+            for (rectangle0, title_bar0), (rectangle1, title_bar1) in zip(self.start, self.end)
+        ])
+
+
 class BaseCodeDisplay(VGroup):
     left_column_class = CodeDisplayWindowColumn
     right_column_class = CodeDisplayWindowColumn
@@ -416,6 +515,17 @@ class BaseCodeDisplay(VGroup):
         self.panel_side.show_second_panel(self.panel_state & PANEL_TRACE)
         return self
 
+    def checkpoint_state(self):
+        # Compared between renders to tell whether a section of a ScriptScene starts from the same display
+        return {'panels': self.panel_state, 'windows': [window.checkpoint_state() for window in self.windows()]}
+
+    def transition_panels(self, panels, **kwargs):
+        # Animated set_panels, e.g. self.play(program.transition_panels(PANEL_CODE+PANEL_VARS))
+        return PanelLayoutTransition(self, lambda display: display.set_panels(panels), **kwargs)
+
+    def windows(self):
+        return [self.panel_main.panel_top, self.panel_main.panel_bottom, self.panel_side.panel_top, self.panel_side.panel_bottom]
+
     @override_animation(Create)
     def _create_override(self, **anim_args):
         anim = AnimationGroup(
@@ -449,3 +559,10 @@ class CodeDisplay(BaseCodeDisplay):
         self.output = self.panel_main.panel_bottom
         self.vars = self.panel_side.panel_top
         self.stack = self.panel_side.panel_bottom
+
+    def trace(self):
+        return trace_program(self.code.content.code.get_new_code())
+
+    def replay(self, events=None, quiet_lines=False):
+        # e.g. for step in program.replay(): self.play(step)
+        return replay_trace(self, self.trace() if events is None else events, quiet_lines)
@@ -0,0 +1,111 @@
+from manim import *
+from manim.mobject.svg.svg_path import SVGPathMobject
+from manimcoder.atomicfile import atomic_path
+from manimcoder.themes import get_theme
+from collections import OrderedDict
+import hashlib
+import json
+import manim
+import os
+import pygments
+import numpy as np
+
+# Bumped whenever what is saved for a glyph changes, so older files are never read back
+GLYPH_FORMAT = 2
+GLYPH_ARRAYS = ['fill_rgbas', 'stroke_rgbas', 'background_stroke_rgbas']
+GLYPH_VALUES = ['stroke_width', 'background_stroke_width', 'fill_color', 'stroke_color', 'color', 'weight', 'slant']
+
+
+def json_value(value):
+    # Colours are saved by name or hex, which manim reads back the same
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+# Rendered, coloured glyphs keyed by everything that affects them. Kept in memory with LRU eviction, and optionally
+# on disk. Lookups always return a deep copy, so callers are free to move and restyle the result.
+class GlyphCache:
+    def __init__(self, max_entries=512, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def use_disk(self, directory=None):
+        self.directory = directory or os.path.join(config.media_dir, 'glyphs')
+
+    @staticmethod
+    def key(text, font, style, lexer, scale):
+        lexer = getattr(lexer, 'name', lexer)
+        style = get_theme(style).digest() # the colours, not the name, as a theme may be registered again under it
+        versions = GLYPH_FORMAT, manim.__version__, pygments.__version__
+        return hashlib.sha256(repr((versions, text, font, style, lexer, scale)).encode()).hexdigest()
+
+    def get(self, key, generate):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key].copy()
+        glyphs = self._load(key)
+        if glyphs is None:
+            self.misses += 1
+            glyphs = generate()
+            self._save(key, glyphs)
+        else:
+            self.disk_hits += 1
+        self.entries[key] = glyphs
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return glyphs.copy()
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def _save(self, key, glyphs):
+        # Every glyph's points and colour arrays, concatenated with their lengths, and its style values as json
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        arrays = {}
+        for name, width in [('points', 3)] + [(name, 4) for name in GLYPH_ARRAYS]:
+            values = [getattr(glyph, name) if name != 'points' else glyph.get_points() for glyph in glyphs]
+            arrays[name] = np.concatenate(values).reshape(-1, width) if values else np.zeros((0, width))
+            arrays[name + '_lengths'] = np.array([len(value) for value in values], dtype=np.int64)
+        values = [[json_value(getattr(glyph, name, None)) for name in GLYPH_VALUES] for glyph in glyphs]
+        arrays['values'] = np.array(json.dumps(values))
+        with atomic_path(self._path(key)) as path, open(path, 'wb') as f: # parallel renders share the directory
+            np.savez(f, **arrays)
+
+    def _load(self, key):
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        with np.load(self._path(key)) as data:
+            arrays = {}
+            for name in ['points'] + GLYPH_ARRAYS:
+                arrays[name] = np.split(data[name], np.cumsum(data[name + '_lengths'])[:-1]) if len(data[name + '_lengths']) else []
+            values = json.loads(str(data['values']))
+        glyphs = VGroup()
+        for i, glyph_values in enumerate(values):
+            glyph = SVGPathMobject('') # the class Text draws glyphs with
+            glyph.set_points(arrays['points'][i])
+            for name in GLYPH_ARRAYS:
+                setattr(glyph, name, arrays[name][i])
+            for name, value in zip(GLYPH_VALUES, glyph_values):
+                setattr(glyph, name, value)
+            glyphs.add(glyph)
+        return glyphs
+
+
+glyph_cache = GlyphCache()
@@ -0,0 +1,46 @@
+from manim import *
+from manimcoder.profiler import profiler
+
+
+class Constraint:
+    # Keeps mobject's anchor point at a corner of reference, plus offset. anchor=None centres the mobject on the point.
+    # Held as plain data rather than a closure, so a copied window lays out its own copies.
+    def __init__(self, mobject, reference, corner=ORIGIN, offset=ORIGIN, anchor=None):
+        self.mobject = mobject
+        self.reference = reference
+        self.corner = corner
+        self.offset = offset
+        self.anchor = anchor
+
+    def place(self):
+        point = self.reference.get_corner(self.corner) + self.offset
+        if hasattr(self.mobject, 'move_reference_to'):
+            self.mobject.move_reference_to(point)
+        elif self.anchor is None:
+            self.mobject.move_to(point)
+        else:
+            self.mobject.shift(point - self.mobject.get_corner(self.anchor))
+
+
+class PanelLayout:
+    # Constraints are only re-applied after something marks the layout dirty, so a static panel costs nothing per frame
+    def __init__(self):
+        self.constraints = []
+        self.dirty = True
+
+    def add(self, *constraints):
+        self.constraints.extend(constraints)
+        self.dirty = True
+        return self
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def update(self):
+        if not self.dirty:
+            return False
+        with profiler.phase('layout'):
+            for constraint in self.constraints: # in order, later constraints may depend on earlier ones
+                constraint.place()
+        self.dirty = False
+        return True
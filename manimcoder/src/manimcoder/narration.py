@@ -0,0 +1,95 @@
+from manim import *
+from manimcoder.atomicfile import atomic_path
+import hashlib
+import json
+import os
+import wave
+import numpy as np
+
+# Where each block of a narration track starts, so ScriptScene can line its script() blocks up with the voice. The
+# starts come from a manifest when there is one, otherwise from the gaps of silence between blocks.
+
+SAMPLE_TYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def narration_directory():
+    return os.environ.get('MANIMCODER_NARRATION_DIR') or os.path.join(config.media_dir, 'narration')
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def wav_duration(path):
+    with wave.open(path) as audio:
+        return audio.getnframes() / audio.getframerate()
+
+
+def parse_timestamp(text):
+    # seconds, m:ss or h:mm:ss
+    seconds = 0.0
+    for part in text.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def read_manifest(path):
+    # a json list of start times, or one start time per line. Blank lines and # comments are ignored.
+    with open(path) as f:
+        if path.endswith('.json'):
+            return [float(start) for start in json.load(f)]
+        lines = [line.split('#')[0] for line in f]
+    return [parse_timestamp(line) for line in lines if line.strip()]
+
+
+def detect_blocks(path, min_gap=0.8, threshold_db=-40, window=0.05):
+    # Reads the audio a window at a time. A block starts at the first loud window after at least min_gap of silence.
+    with wave.open(path) as audio:
+        width, channels, rate = audio.getsampwidth(), audio.getnchannels(), audio.getframerate()
+        if width not in SAMPLE_TYPES:
+            raise ValueError(f'{path}: {8 * width} bit audio is not supported.')
+        full_scale = 128 if width == 1 else 2 ** (8 * width - 1)
+        threshold = full_scale * 10 ** (threshold_db / 20)
+        frames = max(1, int(rate * window))
+        starts, silence, position = [], min_gap, 0
+        while True:
+            data = audio.readframes(frames)
+            if not data:
+                break
+            samples = np.frombuffer(data, dtype=SAMPLE_TYPES[width]).astype(np.float64)
+            if width == 1:
+                samples -= 128
+            count = len(samples) // channels
+            level = np.sqrt(np.mean(samples ** 2)) if len(samples) else 0
+            if level < threshold:
+                silence += count / rate
+            else:
+                if silence >= min_gap:
+                    starts.append(position / rate)
+                silence = 0
+            position += count
+    return starts
+
+
+def narration_timing(path, manifest=None, min_gap=0.8, threshold_db=-40, directory=None):
+    # {'starts': [...], 'duration': seconds}, cached under media/narration by the audio (and manifest) contents
+    directory = directory or narration_directory()
+    key = [file_hash(path), min_gap, threshold_db]
+    if manifest:
+        key.append(file_hash(manifest))
+    cache = os.path.join(directory, hashlib.sha256(repr(key).encode()).hexdigest()[:16] + '.json')
+    if os.path.exists(cache):
+        with open(cache) as f:
+            return json.load(f)
+    timing = {
+        'starts': read_manifest(manifest) if manifest else detect_blocks(path, min_gap, threshold_db),
+        'duration': wav_duration(path),
+    }
+    os.makedirs(directory, exist_ok=True)
+    with atomic_path(cache) as path, open(path, 'w') as f:
+        json.dump(timing, f)
+    return timing
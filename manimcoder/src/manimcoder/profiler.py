@@ -0,0 +1,100 @@
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import time
+
+PHASES = ['highlight', 'diff', 'layout', 'updaters', 'interpolation', 'encode']
+
+
+class RenderProfiler:
+    # Wall time of each play() call, split into manimcoder phases. A play is charged from the end of the one before it,
+    # so the changes() built as its arguments count against it. Phases are exclusive: time spent in a nested phase is
+    # only counted against the innermost one. Anything not in a phase (drawing, hashing, scene code) is 'other'.
+    def __init__(self):
+        self.enabled = False
+        self.plays = []
+        self.record = None
+        self.stack = []
+
+    def start(self):
+        self.enabled = True
+        self.plays = []
+        self._new_record()
+
+    def stop(self):
+        self.enabled = False
+        self.record = None
+        self.stack = []
+
+    def _new_record(self):
+        self.record = {'play': len(self.plays), 'description': '', 'start': time.perf_counter()}
+        self.record.update({phase: 0.0 for phase in PHASES})
+
+    def play(self, description=''):
+        if not self.enabled:
+            return nullcontext()
+        return self._play(description)
+
+    @contextmanager
+    def _play(self, description):
+        self.record['description'] = description
+        try:
+            yield
+        finally:
+            record = self.record
+            record['total'] = time.perf_counter() - record.pop('start')
+            record['other'] = record['total'] - sum(record[phase] for phase in PHASES)
+            self.plays.append(record)
+            self._new_record()
+
+    def phase(self, name):
+        if not self.enabled:
+            return nullcontext()
+        return self._phase(name)
+
+    @contextmanager
+    def _phase(self, name):
+        now = time.perf_counter()
+        if self.stack:
+            parent, since = self.stack[-1]
+            self.record[parent] += now - since
+        self.stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            name, since = self.stack.pop()
+            self.record[name] += now - since
+            if self.stack:
+                self.stack[-1][1] = now
+
+    def timed(self, name, function):
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def totals(self):
+        columns = ['total'] + PHASES + ['other']
+        return {column: sum(record[column] for record in self.plays) for column in columns}
+
+    def table(self):
+        columns = ['total'] + PHASES + ['other']
+        rows = [['play', 'description'] + columns]
+        for record in self.plays:
+            rows.append([str(record['play']), record['description'][:40]] + [f"{record[c]:.3f}" for c in columns])
+        totals = self.totals()
+        rows.append(['', 'TOTAL'] + [f"{totals[c]:.3f}" for c in columns])
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        return '\n'.join(
+            '  '.join(cell.ljust(width) if i < 2 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths)))
+            for row in rows
+        )
+
+    def save(self, path, **extra):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'plays': self.plays, 'totals': self.totals(), **extra}, f, indent=2)
+
+
+profiler = RenderProfiler()
@@ -1,9 +1,6 @@
 from manim import *
-from pygments import highlight
-from pygments.formatters.html import HtmlFormatter
 from pygments.lexers import get_lexer_by_name, guess_lexer_for_filename
 from pygments.styles import get_all_styles
-import bs4
 from enum import Enum
 from collections import namedtuple, defaultdict
 from typing import (
@@ -19,6 +16,15 @@ from typing import (
 )
 from manim.mobject.types.opengl_vectorized_mobject import OpenGLVMobject
 from manim.mobject.types.opengl_surface import OpenGLSurface
+from manimcoder.glyphcache import glyph_cache
+from manimcoder.themes import get_theme
+from manimcoder.profiler import profiler
+from manimcoder.cachekey import CacheKey
+from pygments.token import Token
+from difflib import SequenceMatcher
+import ast
+import hashlib
+import re
 
 
 class ChangePhases(Enum):
@@ -36,6 +42,15 @@ class LinePartCreationActions(Enum):
 
 ChangeDefinition = namedtuple('ChangeDefinition', ['phase', 'change', 'new_elements'])
 
+# Lines are diffed a token at a time, so a changed name is replaced whole rather than letter by letter
+DIFF_TOKEN_RE = re.compile(r'\w+|\s+|\S')
+# Changed lines at least this similar are edited in place, others are deleted and written again
+LINE_EDIT_RATIO = 0.5
+
+
+def diff_tokens(text):
+    return DIFF_TOKEN_RE.findall(text)
+
 
 class ProgramCodeLinePart:
     def __init__(self, new, creation_action):
@@ -44,10 +59,21 @@ class ProgramCodeLinePart:
         self.new = new
         self.action = creation_action
 
+    @property
+    def new(self):
+        return self._new
+
+    @new.setter
+    def new(self, new):
+        self._new = new
+        self._no_whitespace = None
+
     def get_new_code(self, no_whitespace=False):
         if no_whitespace:
-            return self.new.replace(' ', '').replace('\t', '')
-        return self.new
+            if self._no_whitespace is None:
+                self._no_whitespace = self._new.replace(' ', '').replace('\t', '')
+            return self._no_whitespace
+        return self._new
 
     def changes(self, symbols, line_is_new, replacement):
         changes = []
@@ -90,14 +116,46 @@ class ProgramCodeLinePart:
 
 class ProgramCodeLine:
     def __init__(self, line):
+        self.owner = None
         self.parts = [ProgramCodeLinePart(line, LinePartCreationActions.NEW_LINE)]
         self.new = True
         self.replacement = False
         self.symbols = None
+        self.glyph_starts = [0]
+        self.style_runs = None # the colours of the line's glyphs, kept by incremental ProgramCodes
         self.delete = False
+        self.row = None
+
+    # Every edit ends by setting parts, and lines are removed by setting delete, so these are where the code cached by
+    # the line and its ProgramCodeLines is dropped
+    @property
+    def parts(self):
+        return self._parts
+
+    @parts.setter
+    def parts(self, parts):
+        self._parts = parts
+        self.edited()
+
+    @property
+    def delete(self):
+        return self._delete
+
+    @delete.setter
+    def delete(self, delete):
+        self._delete = delete
+        if self.owner is not None:
+            self.owner.edited()
+
+    def edited(self):
+        self._code = {}
+        if self.owner is not None:
+            self.owner.edited()
 
     def get_new_code(self, no_whitespace=False):
-        return ''.join([part.get_new_code(no_whitespace) for part in self.parts])
+        if no_whitespace not in self._code:
+            self._code[no_whitespace] = ''.join([part.get_new_code(no_whitespace) for part in self.parts])
+        return self._code[no_whitespace]
 
     def replace(self, old_text, new_text):
         new_parts = []
@@ -137,6 +195,66 @@ class ProgramCodeLine:
         self.parts = new_parts
         self.replacement = True
 
+    def _split_at(self, index):
+        # Makes index a part boundary, unless it falls inside a part that already has an edit pending
+        new_parts = []
+        pos = 0
+        for part in self.parts:
+            code = part.get_new_code()
+            if pos < index < pos + len(code) and part.current in ('', part.new):
+                new_parts += part.split(index - pos)
+            else:
+                new_parts.append(part)
+            pos += len(code)
+        self.parts = new_parts
+
+    def splice(self, start, stop, new_text):
+        # Replaces characters start to stop of the new code with new_text
+        self._split_at(start)
+        self._split_at(stop)
+        new_parts = []
+        pos = 0
+        for part in self.parts:
+            code = part.get_new_code()
+            if start == stop == pos and new_text:
+                new_parts.append(ProgramCodeLinePart(new_text, LinePartCreationActions.INSERT))
+                new_text = ''
+            if pos < stop and pos + len(code) > start if start < stop else pos < start < pos + len(code):
+                # whole parts once split, but a part with an edit pending keeps its text either side
+                part.new = code[:max(0, start - pos)] + new_text + code[max(0, stop - pos):]
+                new_text = ''
+            pos += len(code)
+            if part.current or part.new:
+                new_parts.append(part)
+        if new_text:
+            new_parts.append(ProgramCodeLinePart(new_text, LinePartCreationActions.INSERT))
+        self.parts = new_parts
+        self.replacement = True
+
+    def set_code(self, new_code):
+        # Edits the line into new_code with the fewest token changes
+        old_tokens, new_tokens = diff_tokens(self.get_new_code()), diff_tokens(new_code)
+        starts = [0]
+        for token in old_tokens:
+            starts.append(starts[-1] + len(token))
+        opcodes = SequenceMatcher(None, old_tokens, new_tokens, autojunk=False).get_opcodes()
+        for tag, i1, i2, j1, j2 in reversed(opcodes): # from the end, so earlier positions stay valid
+            if tag != 'equal':
+                self.splice(starts[i1], starts[i2], ''.join(new_tokens[j1:j2]))
+
+    def take_over(self, line):
+        # Shows this line with the glyphs of a deleted line, so it moves from where that line was instead of being written
+        code = self.get_new_code()
+        self.parts = line.parts
+        self.symbols = line.symbols
+        self.glyph_starts = line.glyph_starts
+        self.style_runs = line.style_runs
+        self.row = line.row
+        self.new = False
+        self.replacement = False
+        if self.get_new_code() != code: # only whitespace differs
+            self.set_code(code)
+
     def changes(self, symbols):
         pos = 0
         for part in self.parts:
@@ -150,42 +268,69 @@ class ProgramCodeLine:
         self.parts = [part]
         self.new = False
         self.replacement = False
+        self.map_glyphs()
+
+    def map_glyphs(self):
+        # glyph_starts[column] is the index of the glyph drawn at that column, or of the next glyph after whitespace
+        self.glyph_starts = [0]
+        for c in self.get_new_code():
+            self.glyph_starts.append(self.glyph_starts[-1] + (c not in ' \t'))
 
     def symbols_range(self, start, stop):
-        symbols = []
-        code = self.get_new_code()
+        length = len(self.glyph_starts) - 1
         if stop < 0:
-            stop = len(code) + stop + 1
-        pos = 0
-        for i, c in enumerate(code):
-            if start <= i < stop:
-                symbols.append(self.symbols[pos])
-            pos += len(c.strip(' ').strip('\t'))
-        return VGroup(*symbols)
-
-    def symbols_by_search(self, text):
-        index = self.get_new_code().index(text)
-        if index == -1:
-            raise IndexError()
-        return self.symbols_range(index, index + len(text))
+            stop = length + stop + 1
+        start, stop = min(max(start, 0), length), min(max(stop, 0), length)
+        return VGroup(*self.symbols.submobjects[self.glyph_starts[start]:self.glyph_starts[stop]])
+
+    def search(self, text):
+        # Columns of every occurrence of text, not overlapping
+        code = self.get_new_code()
+        columns = []
+        index = code.find(text)
+        while index != -1 and text:
+            columns.append(index)
+            index = code.find(text, index + len(text))
+        return columns
+
+    def symbols_by_search(self, text, occurrence=0):
+        columns = self.search(text)
+        if not -len(columns) <= occurrence < len(columns):
+            raise ValueError(f'{text!r} occurs {len(columns)} times in {self.get_new_code()!r}')
+        return self.symbols_range(columns[occurrence], columns[occurrence] + len(text))
+
+    def symbols_by_search_all(self, text):
+        return VGroup(*[self.symbols_range(column, column + len(text)) for column in self.search(text)])
 
 class ProgramCodeLines:
     def __init__(self, code):
         self.lines = []
+        self._code = {}
         self.add_code(code)
 
+    def adopt(self, line):
+        # Lines tell the ProgramCodeLines they belong to when they are edited, so it can drop its cached code
+        line.owner = self
+        self.edited()
+        return line
+
+    def edited(self):
+        self._code.clear()
+
     def add_code(self, code):
         for line in code.split('\n'):
-            self.lines.append(ProgramCodeLine(line))
+            self.lines.append(self.adopt(ProgramCodeLine(line)))
 
     def get_new_code(self, no_whitespace=False):
-        return '\n'.join([line.get_new_code(no_whitespace) for line in self.lines if not line.delete])
+        if no_whitespace not in self._code:
+            self._code[no_whitespace] = '\n'.join([line.get_new_code(no_whitespace) for line in self.lines if not line.delete])
+        return self._code[no_whitespace]
 
     def insert_line(self, index, line):
-        self.lines.insert(index, line)
+        self.lines.insert(index, self.adopt(line))
 
     def append_line(self, line):
-        self.lines.append(line)
+        self.lines.append(self.adopt(line))
 
     def replace(self, line, old_text, new_text):
         self.lines[line].replace(old_text, new_text)
@@ -196,17 +341,82 @@ class ProgramCodeLines:
     def remove_line(self, line):
         self.lines[line].delete = True
 
-    def changes(self, symbols):
-        pos = 0
+    def move_line(self, src, dst):
+        line = self.lines.pop(src)
+        self.lines.insert(dst, line)
+        self.edited()
+        return line
+
+    def swap_lines(self, a, b):
+        self.lines[a], self.lines[b] = self.lines[b], self.lines[a]
+        self.edited()
+
+    def detect_moves(self):
+        # A deleted line and a new line with the same glyphs are one line that moved. The new line takes over the
+        # deleted line's glyphs, so it is transformed into place rather than faded out and written again.
+        deleted = defaultdict(list)
+        for line in self.lines:
+            if line.delete and not line.new and not line.replacement:
+                key = line.get_new_code(True)
+                if key:
+                    deleted[key].append(line)
+        if not deleted:
+            return
+        moved = set()
+        for line in self.lines:
+            if line.new and not line.delete and deleted.get(line.get_new_code(True)):
+                old_line = deleted[line.get_new_code(True)].pop(0)
+                line.take_over(old_line)
+                moved.add(old_line)
+        self.lines = [line for line in self.lines if line not in moved]
+        self.edited()
+
+    def replace_code(self, new_code):
+        # Diffs the lines against new_code, so only lines that changed are animated
+        deleted = [line for line in self.lines if line.delete]
+        old_lines = [line for line in self.lines if not line.delete]
+        old_code = [line.get_new_code() for line in old_lines]
+        new_code = new_code.split('\n')
+        lines = []
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_code, new_code, autojunk=False).get_opcodes():
+            if tag == 'equal':
+                lines += old_lines[i1:i2]
+                continue
+            # each old line is edited into the most similar new line after the last one matched, if any is close enough
+            new_block = new_code[j1:j2]
+            matches = {}
+            start = 0
+            for line in old_lines[i1:i2]:
+                ratios = [
+                    (SequenceMatcher(None, line.get_new_code(), code, autojunk=False).ratio(), j)
+                    for j, code in enumerate(new_block[start:], start)
+                ]
+                ratio, j = max(ratios, default=(0, None))
+                if ratio >= LINE_EDIT_RATIO:
+                    matches[j] = line
+                    start = j + 1
+                else:
+                    line.delete = True
+                    deleted.append(line)
+            for j, code in enumerate(new_block):
+                if j in matches:
+                    matches[j].set_code(code)
+                    lines.append(matches[j])
+                else:
+                    lines.append(self.adopt(ProgramCodeLine(code)))
+        self.lines = deleted + lines # deleted lines have no row, they only fade out
+        self.edited()
+
+    def changes(self, line_symbols):
         new_lines = []
         for line in self.lines:
             if line.delete:
                 for part in line.parts:
                     yield ChangeDefinition(ChangePhases.NEW_LINE_SHUFFLE, FadeOut(part.symbols), None)
                 continue
-            text = line.get_new_code(True)
-            yield from line.changes(symbols[pos:pos+len(text)])
-            pos += len(text)
+            line.row = len(new_lines)
+            if line in line_symbols: # lines left out are unchanged and stay where they are
+                yield from line.changes(line_symbols[line])
             new_lines.append(line)
         self.lines = new_lines
 
@@ -214,6 +424,48 @@ class ProgramCodeLines:
         for line in self.lines:
             yield line.symbols
 
+    def describe(self):
+        # Everything about the lines that decides what changes() will animate
+        return [
+            (line.row, line.delete, line.new, line.replacement, [(part.current, part.new) for part in line.parts])
+            for line in self.lines
+        ]
+
+
+def token_style_runs(tokens, theme):
+    # Merges consecutive tokens of the same style into (style, glyph count) runs. Whitespace has no glyphs.
+    style, length = None, 0
+    for ttype, text in tokens:
+        glyphs = len(text) - text.count(' ') - text.count('\n') - text.count('\t')
+        if not glyphs:
+            continue
+        next_style = theme.style(ttype)
+        if next_style != style and length:
+            yield style, length
+            length = 0
+        style = next_style
+        length += glyphs
+    if length:
+        yield style, length
+
+
+def apply_glyph_styles(glyphs, runs):
+    # runs are (start, length, (color, weight, slant)) over the glyphs, a style of None leaves glyphs untouched.
+    # Colours are written straight into each glyph's arrays, so every glyph is visited at most once.
+    for start, length, style in runs:
+        if style is None:
+            continue
+        c, w, s = style
+        rgb = color_to_rgb(c)
+        color = rgb_to_color(rgb)
+        for glyph in glyphs[start:start + length]:
+            glyph.fill_rgbas[:, :3] = rgb
+            glyph.stroke_rgbas[:, :3] = rgb
+            glyph.fill_color = glyph.stroke_color = c
+            glyph.color = color
+            glyph.weight = w
+            glyph.slant = s
+
 
 class HighlightedCode(Text):
     def __init__(self, code, *args, **kwargs):
@@ -222,123 +474,176 @@ class HighlightedCode(Text):
             self.lexer = get_lexer_by_name(self.lexer)
         self.highlight_style = kwargs.pop('style', 'vim')
         super().__init__(code, *args, **kwargs)
-        html = highlight(code, self.lexer, HtmlFormatter(style=self.highlight_style))
-        soup = bs4.BeautifulSoup(html, features="html.parser")
+        runs = []
         pos = 0
-        for e in soup.select('div > pre')[0]:
-            if isinstance(e, bs4.element.Tag):
-                text = e.text
-            elif isinstance(e, bs4.element.NavigableString):
-                text = e
-            strip_text = text.replace(' ', '').replace('\n', '').replace('\t', '')
-            group = self[pos:pos + len(strip_text)]
-            # c = random_bright_color()
-            if isinstance(e, bs4.element.Tag):
-                cls = e.get('class')
-                if cls:
-                    assert (len(cls) == 1)
-                    c, w, s = {
-                        'n': ('#FFFFFF', NORMAL, NORMAL),  # ???
-                        'p': ('#FFFFFF', NORMAL, NORMAL),  # ???
-
-                        'c': ('#408080', NORMAL, ITALIC),  # Comment
-                        'k': ('#008000', BOLD, NORMAL),  # Keyword
-                        'o': ('#666666', NORMAL, NORMAL),  # Operator
-                        'ch': ('#408080', NORMAL, ITALIC),  # Comment.Hashbang
-                        'cm': ('#408080', NORMAL, ITALIC),  # Comment.Multiline
-                        'cp': ('#BC7A00', NORMAL, NORMAL),  # Comment.Preproc
-                        'cpf': ('#408080', NORMAL, ITALIC),  # Comment.PreprocFile
-                        'c1': ('#408080', NORMAL, ITALIC),  # Comment.Single
-                        'cs': ('#408080', NORMAL, ITALIC),  # Comment.Special
-                        'gd': ('#A00000', NORMAL, NORMAL),  # Generic.Deleted
-                        'ge': ('#FFFFFF', NORMAL, ITALIC),  # Generic.Emph
-                        'gr': ('#FF0000', NORMAL, NORMAL),  # Generic.Error
-                        'gh': ('#000080', BOLD, NORMAL),  # Generic.Heading
-                        'gi': ('#00A000', NORMAL, NORMAL),  # Generic.Inserted
-                        'go': ('#888888', NORMAL, NORMAL),  # Generic.Output
-                        'gp': ('#000080', BOLD, NORMAL),  # Generic.Prompt
-                        'gs': ('#FFFFFF', BOLD, NORMAL),  # Generic.Strong
-                        'gu': ('#800080', BOLD, NORMAL),  # Generic.Subheading
-                        'gt': ('#0044DD', NORMAL, NORMAL),  # Generic.Traceback
-                        'kc': ('#008000', BOLD, NORMAL),  # Keyword.Constant
-                        'kd': ('#008000', BOLD, NORMAL),  # Keyword.Declaration
-                        'kn': ('#008000', BOLD, NORMAL),  # Keyword.Namespace
-                        'kp': ('#008000', NORMAL, NORMAL),  # Keyword.Pseudo
-                        'kr': ('#008000', BOLD, NORMAL),  # Keyword.Reserved
-                        'kt': ('#B00040', NORMAL, NORMAL),  # Keyword.Type
-                        'm': ('#666666', NORMAL, NORMAL),  # Literal.Number
-                        's': ('#BA2121', NORMAL, NORMAL),  # Literal.String
-                        'na': ('#7D9029', NORMAL, NORMAL),  # Name.Attribute
-                        'nb': ('#008000', NORMAL, NORMAL),  # Name.Builtin
-                        'nc': ('#4444FF', BOLD, NORMAL),  # Name.Class
-                        'no': ('#880000', NORMAL, NORMAL),  # Name.Constant
-                        'nd': ('#AA22FF', NORMAL, NORMAL),  # Name.Decorator
-                        'ni': ('#999999', BOLD, NORMAL),  # Name.Entity
-                        'ne': ('#D2413A', BOLD, NORMAL),  # Name.Exception
-                        'nf': ('#4444FF', NORMAL, NORMAL),  # Name.Function
-                        'nl': ('#A0A000', NORMAL, NORMAL),  # Name.Label
-                        'nn': ('#4444FF', BOLD, NORMAL),  # Name.Namespace
-                        'nt': ('#008000', BOLD, NORMAL),  # Name.Tag
-                        'nv': ('#19177C', NORMAL, NORMAL),  # Name.Variable
-                        'ow': ('#AA22FF', BOLD, NORMAL),  # Operator.Word
-                        'w': ('#bbbbbb', NORMAL, NORMAL),  # Text.Whitespace
-                        'mb': ('#666666', NORMAL, NORMAL),  # Literal.Number.Bin
-                        'mf': ('#666666', NORMAL, NORMAL),  # Literal.Number.Float
-                        'mh': ('#666666', NORMAL, NORMAL),  # Literal.Number.Hex
-                        'mi': ('#666666', NORMAL, NORMAL),  # Literal.Number.Integer
-                        'mo': ('#666666', NORMAL, NORMAL),  # Literal.Number.Oct
-                        'sa': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Affix
-                        'sb': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Backtick
-                        'sc': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Char
-                        'dl': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Delimiter
-                        'sd': ('#BA2121', NORMAL, ITALIC),  # Literal.String.Doc
-                        's2': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Double
-                        'se': ('#BB6622', BOLD, NORMAL),  # Literal.String.Escape
-                        'sh': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Heredoc
-                        'si': ('#BB6688', BOLD, NORMAL),  # Literal.String.Interpol
-                        'sx': ('#008000', NORMAL, NORMAL),  # Literal.String.Other
-                        'sr': ('#BB6688', NORMAL, NORMAL),  # Literal.String.Regex
-                        's1': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Single
-                        'ss': ('#19177C', NORMAL, NORMAL),  # Literal.String.Symbol
-                        'bp': ('#008000', NORMAL, NORMAL),  # Name.Builtin.Pseudo
-                        'fm': ('#4444FF', NORMAL, NORMAL),  # Name.Function.Magic
-                        'vc': ('#19177C', NORMAL, NORMAL),  # Name.Variable.Class
-                        'vg': ('#19177C', NORMAL, NORMAL),  # Name.Variable.Global
-                        'vi': ('#19177C', NORMAL, NORMAL),  # Name.Variable.Instance
-                        'vm': ('#19177C', NORMAL, NORMAL),  # Name.Variable.Magic
-                        'il': ('#666666', NORMAL, NORMAL),  # Literal.Number.Integer.Long
-                    }[cls[0]]
-                    # print(c, self.code[pos:pos+len(text)])
-                    group.set_color(c)
-                    group.set_weight(w)
-                    group.set_slant(s)
-            pos += len(strip_text)
+        for style, length in token_style_runs(self.lexer.get_tokens(code), get_theme(self.highlight_style)):
+            runs.append((pos, length, style))
+            pos += length
+        self.apply_styles(runs)
+
+    def apply_styles(self, runs):
+        apply_glyph_styles(self.submobjects, runs)
+        return self
+
+
+class ProgramCodeChanges(AnimationGroup):
+    # New glyphs become children of the ProgramCode once their animations are done. Adding them any earlier would
+    # show them during a ReplacementTransform, and let the scene break the ProgramCode up when it adds the target.
+    def __init__(self, program, symbols, *animations, **kwargs):
+        super().__init__(*animations, **kwargs)
+        self.program = program
+        self.symbols = symbols
+
+    def clean_up_from_scene(self, scene):
+        super().clean_up_from_scene(scene)
+        if self.program in scene.get_mobject_family_members():
+            scene.remove(*self.symbols) # drawn as part of the ProgramCode from now on
+        self.program.add(*self.symbols)
+        adopted = {id(symbols) for symbols in self.symbols}
+        self.program.pending_symbols = [symbols for symbols in self.program.pending_symbols if id(symbols) not in adopted]
+
+
+LINE_HEIGHTS = {}
+LEXERS = {}
+
+
+def get_lexer(lexer):
+    if isinstance(lexer, str):
+        if lexer not in LEXERS:
+            LEXERS[lexer] = get_lexer_by_name(lexer)
+        return LEXERS[lexer]
+    return lexer
+
+
+def char_column(text, offset):
+    # ast column offsets count UTF-8 bytes
+    return len(text.encode()[:offset].decode(errors='ignore'))
+
+
+def call_name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
 
 class ProgramCode(VMobject):
-    def __init__(self, code, lexer='text', highlight_style='zenburn', text_scale=0.8):
+    font = 'FreeMono'
+    def __init__(self, code, lexer='text', highlight_style='zenburn', text_scale=0.8, incremental=False, detect_moves=False):
         super().__init__()
         self.code = ProgramCodeLines(code)
         self.lexer = 'text' if lexer is None else lexer
         self.highlight_style = highlight_style
         self.text_scale = text_scale
+        self.incremental = incremental
+        self.detect_moves = detect_moves # a deleted line and an added one with the same text are animated as one moving
         self.reference_dot = Dot(radius=0)
         self.add(self.reference_dot)
         self.all_text = None
+        self.rendered_settings = None # what the glyphs on screen were rendered with
+        self.pending_symbols = [] # built by changes(), not yet children
+        self.pending_anchor = None
+        self._syntax_tree = None
+        self._tokens = None
 
     def _gen_coloured_text_symbols(self):
-        code = self.code.get_new_code()
-        all_text = HighlightedCode(code, font="FreeMono", lexer=self.lexer, style=self.highlight_style).scale(self.text_scale)
-        self.all_text = all_text
-        if len(all_text):
-            all_text.align_to(self.reference_dot, UP + LEFT)
-        # print(HtmlFormatter().get_style_defs('.zenburn'))
-        return all_text
+        # Anchored like a single line at row 0, so lines re-rendered on their own line up with the rest
+        self.all_text = self._gen_coloured_line_symbols(self.code.get_new_code(), 0)
+        return self.all_text
+
+    def _highlighted_code(self, code):
+        with profiler.phase('highlight'):
+            return glyph_cache.get(
+                glyph_cache.key(code, self.font, self.highlight_style, self.lexer, self.text_scale),
+                lambda: HighlightedCode(code, font=self.font, lexer=self.lexer, style=self.highlight_style).scale(self.text_scale)
+            )
+
+    def _line_height(self):
+        key = (self.font, self.text_scale)
+        if key not in LINE_HEIGHTS:
+            probe = Text('|\n|', font=self.font).scale(self.text_scale)
+            LINE_HEIGHTS[key] = probe[0].get_top()[1] - probe[1].get_top()[1]
+        return LINE_HEIGHTS[key]
+
+    def _gen_coloured_line_symbols(self, code, row):
+        # A '|' on the line above gives every line the same anchor to position against, whatever its indent
+        line_text = self._highlighted_code('|\n' + code)
+        anchor = self.reference_dot.get_center() + UP * (1 - row) * self._line_height()
+        line_text.shift(anchor - line_text[0].get_corner(UP + LEFT))
+        return VGroup(*line_text[1:])
+
+    def render_settings(self):
+        return (
+            self.font, getattr(self.highlight_style, 'name', self.highlight_style), getattr(self.lexer, 'name', self.lexer),
+            self.text_scale,
+        )
+
+    def _line_style_runs(self):
+        # (start, length, style) runs of each line's glyphs, from lexing the whole code, so a token spanning lines like
+        # a docstring is coloured the same as in a full render
+        runs = token_style_runs(get_lexer(self.lexer).get_tokens(self.code.get_new_code()), get_theme(self.highlight_style))
+        style, remaining = None, 0
+        line_runs = {}
+        for line in self.code.lines:
+            if line.delete: continue
+            line_runs[line] = []
+            pos, length = 0, len(line.get_new_code(True))
+            while pos < length:
+                if not remaining:
+                    style, remaining = next(runs, (None, length - pos))
+                count = min(remaining, length - pos)
+                line_runs[line].append((pos, count, style))
+                pos += count
+                remaining -= count
+            line_runs[line] = tuple(line_runs[line])
+        return line_runs
+
+    def _gen_line_symbols(self):
+        # A change of font, style, lexer or scale changes every glyph, so the incremental path renders everything once
+        line_symbols = {}
+        settings = self.render_settings()
+        full = not self.incremental or settings != self.rendered_settings
+        self.rendered_settings = settings
+        line_runs = self._line_style_runs() if self.incremental else {}
+        if full:
+            all_text = self._gen_coloured_text_symbols()
+            pos = 0
+            for line in self.code.lines:
+                if line.delete: continue
+                length = len(line.get_new_code(True))
+                line_symbols[line] = all_text[pos:pos + length]
+                line.style_runs = line_runs.get(line)
+                pos += length
+            return line_symbols
+        all_symbols = []
+        row = 0
+        for line in self.code.lines:
+            if line.delete: continue
+            runs = line_runs[line]
+            symbols = None
+            if line.new or line.replacement:
+                symbols = self._gen_coloured_line_symbols(line.get_new_code(), row)
+            elif line.row != row or runs != line.style_runs: # moved, or recoloured by an edit to another line
+                symbols = line.symbols.copy().shift(DOWN * (row - line.row) * self._line_height())
+            if symbols is not None:
+                apply_glyph_styles(symbols.submobjects, runs) # lexed on its own, the line may be coloured wrongly
+                line_symbols[line] = symbols
+            line.style_runs = runs
+            all_symbols.append(line_symbols.get(line, line.symbols))
+            row += 1
+        self.all_text = VGroup(*all_symbols)
+        return line_symbols
 
     def insert_line(self, before_line, text):
-        self.code.insert_line(before_line, ProgramCodeLine(text))
+        line = ProgramCodeLine(text)
+        self.code.insert_line(before_line, line)
+        return line
 
-    def append_line(self, line):
-        self.code.lines.append(ProgramCodeLine(line))
+    def append_line(self, text):
+        line = ProgramCodeLine(text)
+        self.code.append_line(line)
+        return line
 
     def replace(self, line, old_text, new_text):
         self.code.replace(line, old_text, new_text)
@@ -349,27 +654,177 @@ class ProgramCode(VMobject):
     def remove_line(self, line):
         self.code.remove_line(line)
 
+    def move_line(self, src, dst):
+        return self.code.move_line(src, dst)
+
+    def swap_lines(self, a, b):
+        self.code.swap_lines(a, b)
+
     def remove_all_lines(self):
         for lineno, _ in enumerate(self.code.lines):
             self.remove_line(lineno)
 
     def replace_code(self, new_code):
-        self.remove_all_lines()
-        self.code.add_code(new_code)
+        self.code.replace_code(new_code)
+
+    def changes_key(self):
+        # Same code, style and position give the same glyphs, so this is all a cache needs to know about the changes
+        return repr((
+            self.render_settings(), self.incremental, self.reference_dot.get_center().round(4).tolist(), self.code.describe(),
+        ))
 
     def changes(self):
+        old_symbols = {id(symbols): symbols for symbols in self.submobjects if symbols is not self.reference_dot}
+        if self.detect_moves:
+            self.code.detect_moves()
+        # the glyphs on screen are what the changes transform from, and may have been moved or restyled since they were
+        # built, e.g. by .animate.set_color()
+        key = self.changes_key() + CacheKey().update(list(old_symbols.values()) + self.pending_symbols).hexdigest()
         phases = defaultdict(list)
-        for phase, change, symbols in self.code.changes(self._gen_coloured_text_symbols()):
-            if symbols:
-                symbols.relative_position = self.reference_dot.get_center() - symbols.get_center()
-                symbols.add_updater(lambda d: d.move_to(self.reference_dot.get_center() - d.relative_position))
-            phases[phase].append(change)
+        with profiler.phase('diff'):
+            for phase, change, symbols in self.code.changes(self._gen_line_symbols()):
+                phases[phase].append(change)
+        new_symbols = {id(symbols): symbols for symbols in self.code.symbols()}
+        # Replaced glyphs leave now, so the scene can take them over while they animate out
+        self.remove(*[symbols for symbols_id, symbols in old_symbols.items() if symbols_id not in new_symbols])
         for phase in phases:
             phases[phase] = AnimationGroup(*phases[phase])
         changes = []
         for phase in sorted(phases.keys(), key=lambda p: p.value):
             changes.append(phases[phase])
-        return AnimationGroup(*changes, lag_ratio=0) #TODO: set time of irrelevant changes to 0, so lag time can be set to 1 without causing pauses
+        self.pending_symbols = [symbols for symbols_id, symbols in new_symbols.items() if symbols_id not in old_symbols]
+        self.pending_anchor = self.reference_dot.get_center().copy()
+        changes = ProgramCodeChanges(
+            self,
+            self.pending_symbols,
+            *changes,
+            lag_ratio=0
+        ) #TODO: set time of irrelevant changes to 0, so lag time can be set to 1 without causing pauses
+        key += repr([(phase.name, [type(change).__name__ for change in phases[phase].animations]) for phase in sorted(phases, key=lambda p: p.value)])
+        changes.cache_key = hashlib.sha256(key.encode()).hexdigest()
+        return changes
+
+    def move_reference_to(self, point):
+        # Glyphs are children positioned relative to the reference dot, so they only move when it does
+        shift = point - self.reference_dot.get_center()
+        if np.any(shift):
+            self.shift(shift)
+        self.move_pending_symbols()
+        return self
+
+    def move_pending_symbols(self):
+        # Glyphs built by changes() are not children until they have been animated, so a layout move while they are
+        # pending moves them here, by however far the reference dot has moved since they were built
+        if not self.pending_symbols:
+            return
+        shift = self.reference_dot.get_center() - self.pending_anchor
+        if np.any(shift):
+            for symbols in self.pending_symbols:
+                symbols.shift(shift)
+            self.pending_anchor = self.reference_dot.get_center().copy()
 
     def symbols(self):
         return VGroup(*self.code.symbols())
+
+    def visible_lines(self):
+        return [line for line in self.code.lines if not line.delete]
+
+    def tokens(self):
+        # (line, column, token type, text) of every token with glyphs. The whole code is lexed, so a string spanning
+        # lines is a string on each of them, and lexed again only once the code changes.
+        code, lexer = self.code.get_new_code(), get_lexer(self.lexer)
+        if self._tokens is None or self._tokens[:2] != (code, lexer):
+            tokens = []
+            row, line_start = 0, 0
+            for position, ttype, text in lexer.get_tokens_unprocessed(code):
+                for i, piece in enumerate(text.split('\n')):
+                    if i:
+                        position += 1
+                        row, line_start = row + 1, position
+                    column = position - line_start
+                    position += len(piece)
+                    if tokens and ttype in Token.String and tokens[-1][2] in Token.String:
+                        last_row, last_column, last_ttype, last_text = tokens[-1]
+                        if last_row == row and last_column + len(last_text) == column: # quotes and contents are one string
+                            tokens[-1] = (row, last_column, last_ttype, last_text + piece)
+                            continue
+                    if piece.strip():
+                        tokens.append((row, column, ttype, piece))
+            self._tokens = (code, lexer, tokens)
+        lines = self.visible_lines()
+        for row, column, ttype, text in self._tokens[2]:
+            yield lines[row], column, ttype, text
+
+    def syntax_tree(self):
+        # The Python parse of the code, or None while it is not valid Python. Parsed again only once the code changes.
+        code = self.code.get_new_code()
+        if self._syntax_tree is None or self._syntax_tree[0] != code:
+            try:
+                tree = ast.parse(code)
+            except SyntaxError:
+                tree = None
+            self._syntax_tree = (code, tree)
+        return self._syntax_tree[1]
+
+    def select_span(self, start, end):
+        # Glyphs from (row, column) up to (row, column), rows counted over the lines still shown
+        lines = self.visible_lines()
+        glyphs = []
+        for row in range(start[0], end[0] + 1):
+            line = lines[row]
+            stop = end[1] if row == end[0] else len(line.get_new_code())
+            glyphs += line.symbols_range(start[1] if row == start[0] else 0, stop).submobjects
+        return VGroup(*glyphs)
+
+    def node_position(self, lineno, col_offset):
+        # (row, column) of an ast line number and column offset
+        return lineno - 1, char_column(self.visible_lines()[lineno - 1].get_new_code(), col_offset)
+
+    def select_node(self, node):
+        return self.select_span(
+            self.node_position(node.lineno, node.col_offset), self.node_position(node.end_lineno, node.end_col_offset)
+        )
+
+    def select_tokens(self, ttype, text=None):
+        # A group for each token of ttype (or a subtype of it, e.g. Token.Keyword), e.g. select_tokens(Token.Keyword)
+        return VGroup(*[
+            line.symbols_range(column, column + len(token_text)) for line, column, token_type, token_text in self.tokens()
+            if token_type in ttype and (text is None or token_text == text)
+        ])
+
+    def select_identifier(self, name):
+        return self.select_tokens(Token.Name, name)
+
+    def select_arguments(self, function):
+        # A group for the argument list, less its parentheses, of each call to function and of its definition
+        tree = self.syntax_tree()
+        if tree is None:
+            raise ValueError('The code is not valid Python, so has no arguments to select')
+        spans = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Call) and call_name(node.func) == function:
+                row, column = self.node_position(node.func.end_lineno, node.func.end_col_offset)
+                start = row, self.visible_lines()[row].get_new_code().index('(', column) + 1
+                end_row, end_column = self.node_position(node.end_lineno, node.end_col_offset)
+                spans.append((start, (end_row, end_column - 1)))
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == function:
+                arguments = node.args
+                parts = arguments.posonlyargs + arguments.args + arguments.kwonlyargs + [
+                    part for part in [arguments.vararg, arguments.kwarg] + arguments.defaults + arguments.kw_defaults
+                    if part is not None
+                ]
+                if not parts:
+                    row, column = self.node_position(node.lineno, node.col_offset)
+                    spans.append(((row, column), None)) # an empty group, in the order of the def
+                    continue
+                first = min(parts, key=lambda part: (part.lineno, part.col_offset))
+                last = max(parts, key=lambda part: (part.end_lineno, part.end_col_offset))
+                row, column = self.node_position(first.lineno, first.col_offset)
+                if first in (arguments.vararg, arguments.kwarg): # the node starts at the name, after its * or **
+                    before = self.visible_lines()[row].get_new_code()[:column].rstrip()
+                    column = len(before.rstrip('*'))
+                spans.append(((row, column), self.node_position(last.end_lineno, last.end_col_offset)))
+        # ast.walk is breadth first, so calls nested in others would come after later ones
+        return VGroup(*[
+            VGroup() if end is None else self.select_span(start, end) for start, end in sorted(spans, key=lambda span: span[0])
+        ])
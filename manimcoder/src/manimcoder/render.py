@@ -0,0 +1,253 @@
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import glob
+import importlib.util
+import inspect
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Renders every scene in a module in parallel, one manim process per scene, e.g.
+#   python -m manimcoder.render videos/function_intro.py -- -qh
+#   python -m manimcoder.render videos/function_intro.py FunctionArguments SpecialCases -j 2 -- -ql
+# Arguments after -- are passed on to manim. Each scene's output goes to logs/<module>/<Scene>.log in the media
+# directory (media, or manim's --media_dir), and the ScriptScene script of each scene is printed in the order the
+# scenes are defined.
+#
+# With --segments N, each ScriptScene is also split at script() calls into up to N parts of similar length, rendered
+# by separate processes and joined without re-encoding. Each part runs construct() from the start, skipping the
+# animations before it, so it starts from exactly the state a full render would have reached.
+
+SCRIPT_MARKER = '=' * 20
+PREVIEW_ARGS = ['-p', '--preview']
+
+
+def scene_names(path):
+    # Scenes in the order they appear in the file, unlike manim -a which sorts them by name
+    from manim import Scene
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    scenes = [
+        cls for cls in vars(module).values()
+        if inspect.isclass(cls) and issubclass(cls, Scene) and cls is not Scene and cls.__module__ == name
+    ]
+    return [cls.__name__ for cls in sorted(scenes, key=lambda cls: inspect.getsourcelines(cls)[1])]
+
+
+def script_text(output):
+    # ScriptScene.render prints its script between two marker lines, once the scene has finished
+    lines = output.split('\n')
+    markers = [i for i, line in enumerate(lines) if line.strip() == SCRIPT_MARKER]
+    if len(markers) < 2:
+        return None
+    return '\n'.join(lines[markers[-2] + 1:markers[-1]]).strip('\n')
+
+
+def manim_option(manim_args, name, default=None):
+    # The value of an option passed on to manim, as --name value or --name=value. Like manim, the last one counts.
+    value = default
+    for i, arg in enumerate(manim_args):
+        if arg == name and i + 1 < len(manim_args):
+            value = manim_args[i + 1]
+        elif arg.startswith(name + '='):
+            value = arg[len(name) + 1:]
+    return value
+
+
+def without_option(manim_args, name):
+    args, skip = [], False
+    for arg in manim_args:
+        if skip or arg.startswith(name + '='):
+            skip = False
+        elif arg == name:
+            skip = True
+        else:
+            args.append(arg)
+    return args
+
+
+def split_sections(sections, plays, count):
+    # Groups consecutive [first play, run time] sections into at most count segments of similar run time, returned as
+    # (first play, last play) pairs
+    if not sections or not plays:
+        return []
+    total = sum(duration for _, duration in sections)
+    boundaries = [sections[0][0]]
+    elapsed = 0.0
+    for (_, duration), (next_first, _) in zip(sections, sections[1:]):
+        elapsed += duration
+        if len(boundaries) < count and elapsed >= total * len(boundaries) / count:
+            boundaries.append(next_first)
+    segments = zip(boundaries, boundaries[1:] + [plays])
+    parts = [(first, end - 1) for first, end in segments if first < end]
+    if len(parts) > 1 and parts[0][1] == 0: # manim reads -n 0,0 as no limit, so a first part of one play joins the next
+        parts[:2] = [(parts[0][0], parts[1][1])]
+    return parts
+
+
+class SceneJob:
+    def __init__(self, path, scene, manim_args, log_dir, name=None, extra_args=()):
+        self.path = path
+        self.scene = scene
+        self.name = name or scene
+        self.command = [sys.executable, '-m', 'manim', path, scene] + list(manim_args) + list(extra_args)
+        self.log_path = os.path.join(log_dir, self.name + '.log')
+        self.env = None
+        self.returncode = None
+        self.started = None
+        self.duration = None
+        self.script = None
+
+    def run(self):
+        start = self.started = time.time()
+        with open(self.log_path, 'w') as log:
+            self.returncode = subprocess.call(self.command, stdout=log, stderr=subprocess.STDOUT, env=self.env)
+        self.duration = time.time() - start
+        with open(self.log_path) as log:
+            self.script = script_text(log.read())
+        status = 'done' if self.returncode == 0 else f'FAILED ({self.returncode}), see {self.log_path}'
+        print(f'{self.name}: {status} in {self.duration:.0f}s', flush=True)
+        return self
+
+
+class SegmentJob(SceneJob):
+    # One part of a scene, rendered into a media directory of its own so parallel parts never share partial movie files
+    def __init__(self, path, scene, manim_args, log_dir, index, first, last, plan_path):
+        media_dir = manim_option(manim_args, '--media_dir', 'media')
+        self.media_dir = os.path.join(media_dir, 'segments', scene, str(index))
+        plays = f'{first},{last}' if last is not None else str(first)
+        super().__init__(
+            path, scene, without_option(manim_args, '--media_dir'), log_dir, name=f'{scene}.{index}',
+            extra_args=['-n', plays, '--media_dir', self.media_dir]
+        )
+        # every part scales its blocks with the durations the plan pass used, which it saved in the plan
+        self.env = dict(
+            os.environ, MANIMCODER_SEGMENT_PLAN=os.path.abspath(plan_path),
+            MANIMCODER_NARRATION_DIR=os.path.abspath(os.path.join(media_dir, 'narration')),
+        )
+
+    def movie_file(self):
+        movies = glob.glob(os.path.join(self.media_dir, 'videos', '**', self.scene + '.*'), recursive=True)
+        movies = [movie for movie in movies if 'partial_movie_files' not in movie]
+        return max(movies, key=os.path.getmtime) if movies else None
+
+
+class SegmentedScene:
+    def __init__(self, plan_job, segment_jobs, media_dir, narration=None):
+        self.scene = plan_job.scene
+        self.media_dir = media_dir
+        self.narration = narration
+        self.plan_job = plan_job
+        self.segment_jobs = segment_jobs
+        self.log_path = plan_job.log_path
+        self.script = plan_job.script
+        self.returncode = None
+
+    def join(self):
+        # The parts were encoded with the same settings, so the concat demuxer can join them without re-encoding
+        if not self.segment_jobs:
+            self.returncode = self.plan_job.returncode
+            return self
+        if any(job.returncode != 0 for job in self.segment_jobs):
+            failed = [job for job in self.segment_jobs if job.returncode != 0]
+            self.log_path = failed[0].log_path
+            self.returncode = failed[0].returncode
+            return self
+        movies = [job.movie_file() for job in self.segment_jobs]
+        if None in movies:
+            self.log_path = self.segment_jobs[movies.index(None)].log_path
+            self.returncode = 1
+            return self
+        first = self.segment_jobs[0]
+        movie = os.path.join(self.media_dir, os.path.relpath(movies[0], first.media_dir))
+        os.makedirs(os.path.dirname(movie), exist_ok=True)
+        file_list = os.path.join(os.path.dirname(first.media_dir), 'segments.txt')
+        with open(file_list, 'w') as f:
+            for part in movies:
+                f.write(f"file '{os.path.abspath(part)}'\n")
+        command = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', file_list]
+        if self.narration: # parts are rendered silent, the narration is added to the whole
+            command += ['-i', self.narration, '-map', '0:v', '-map', '1:a', '-c:a', 'aac']
+        command += ['-c:v', 'copy', movie]
+        with open(self.log_path, 'a') as log:
+            self.returncode = subprocess.call(command, stdout=log, stderr=subprocess.STDOUT)
+        print(f'{self.scene}: joined {len(movies)} parts into {movie}', flush=True)
+        return self
+
+
+def plan_segments(plan_job, manim_args, log_dir, segments):
+    # The plan is saved by ScriptScene at the end of the fast (-s) pass. Other scenes render whole.
+    plan_path = os.path.join(manim_option(manim_args, '--media_dir', 'media'), 'segments', plan_job.scene + '.json')
+    if plan_job.returncode != 0 or not os.path.exists(plan_path) or os.path.getmtime(plan_path) < plan_job.started:
+        return None, None
+    with open(plan_path) as f:
+        plan = json.load(f)
+    parts = split_sections(plan['sections'], plan['plays'], segments)
+    if not parts: # nothing is played, so there is nothing to split
+        return None, None
+    return plan.get('narration'), [
+        SegmentJob(
+            plan_job.path, plan_job.scene, manim_args, log_dir, index, first, None if index == len(parts) - 1 else last,
+            plan_path
+        )
+        for index, (first, last) in enumerate(parts)
+    ]
+
+
+def render(path, scenes=None, manim_args=(), jobs=None, segments=None):
+    module = os.path.splitext(os.path.basename(path))[0]
+    media_dir = manim_option(manim_args, '--media_dir', 'media')
+    log_dir = os.path.join(media_dir, 'logs', module)
+    os.makedirs(log_dir, exist_ok=True)
+    scenes = scenes or scene_names(path)
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool: # each thread just waits on its manim process
+        if not segments:
+            render_jobs = [SceneJob(path, scene, manim_args, log_dir) for scene in scenes]
+            list(pool.map(SceneJob.run, render_jobs))
+            return render_jobs
+        manim_args = [arg for arg in manim_args if arg not in PREVIEW_ARGS]
+        plan_jobs = [SceneJob(path, scene, manim_args, log_dir, name=scene + '.plan', extra_args=['-s']) for scene in scenes]
+        list(pool.map(SceneJob.run, plan_jobs))
+        results, work = [], []
+        for plan_job in plan_jobs:
+            narration, segment_jobs = plan_segments(plan_job, manim_args, log_dir, segments)
+            if segment_jobs is None:
+                job = SceneJob(path, plan_job.scene, manim_args, log_dir)
+                results.append(job)
+                work.append(job)
+            else:
+                results.append(SegmentedScene(plan_job, segment_jobs, media_dir, narration))
+                work.extend(segment_jobs)
+        list(pool.map(SceneJob.run, work))
+    for result in results:
+        if isinstance(result, SegmentedScene):
+            result.join()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the scenes of a manim module in parallel.')
+    parser.add_argument('file')
+    parser.add_argument('scenes', nargs='*', help='scenes to render, all of them by default')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='scenes to render at once, the CPU count by default')
+    parser.add_argument('--segments', type=int, default=None, help='split each ScriptScene into up to this many parts')
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # manim's options take values, which would be taken for scene names if they were mixed in with ours
+    split = argv.index('--') if '--' in argv else len(argv)
+    args, manim_args = parser.parse_args(argv[:split]), argv[split + 1:]
+
+    render_jobs = render(args.file, args.scenes, manim_args, args.jobs, args.segments)
+    scripts = [job.script for job in render_jobs if job.script is not None]
+    print('\n\n'.join([SCRIPT_MARKER] + scripts + [SCRIPT_MARKER]))
+    failed = [job for job in render_jobs if job.returncode != 0]
+    for job in failed:
+        print(f'{job.scene} failed, see {job.log_path}', file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,44 @@
 from manim import *
+from manimcoder.profiler import profiler
+from manimcoder.glyphcache import glyph_cache
+from manimcoder.checkpoint import SceneCheckpoints
+from manimcoder.cachekey import ScriptSceneFileWriter, play_cache_key
+from manimcoder.narration import narration_timing, narration_directory
+from collections import deque
+import json
+import os
 import re
 
 starting_whitespace_re = re.compile(r"^( *)")
 ignore_start_end_blanks = re.compile(r"^([ \t\r\f\v]*\n)*(.*?)(\n[ \t\r\f\v]*)*$", flags=re.DOTALL)
 
 class ScriptScene(Scene):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
+    profile = bool(os.environ.get('MANIMCODER_PROFILE')) # time each play() and report where it went after render()
+    checkpoint = bool(os.environ.get('MANIMCODER_CHECKPOINT')) # re-renders fast-forward through unchanged sections
+    narration = None # wav file; each script() block is timed to start with the next block of speech in it
+    narration_manifest = None # start time of each block, if silence detection does not find them
+    narration_gap = 0.8 # seconds of silence between blocks of speech
+    def __init__(self, renderer=None, camera_class=Camera, *args, **kwargs):
+        if renderer is None and config.renderer != 'opengl':
+            # partial movie files are named by play_cache_key, so unchanged plays are found again on re-render
+            renderer = CairoRenderer(
+                file_writer_class=ScriptSceneFileWriter,
+                camera_class=camera_class,
+                skip_animations=kwargs.get('skip_animations', False),
+            )
+        super().__init__(renderer, camera_class, *args, **kwargs)
         self.script_lines = []
+        self.sections = [[0, 0.0]] # [first play, run time] of each part of the scene between script() calls
+        self.checkpoints = None
+        self.resume_movies = deque() # partial movie files of the section being fast-forwarded
+        self.resume_until = None
+        self.scene_time = 0.0
+        self.narration_starts = None
+        self.narration_duration = None
+        self.block_durations = [0.0] # run time of each script() block before time_scale, the first is before any script()
+        self.last_block_durations = []
+        self.time_scale = 1
+        self.padding = False
 
     def script(self, text, *args, **kwargs):
         text = ignore_start_end_blanks.match(text).group(2)
@@ -16,10 +47,168 @@ class ScriptScene(Scene):
         spaces = min(spaces) if spaces else 0
         text = [l[spaces:] for l in text]
         self.script_lines.append('\n'.join(text))
+        self.align_to_narration(len(self.script_lines) - 1)
+        if self.renderer.num_plays > self.sections[-1][0]:
+            self.sections.append([self.renderer.num_plays, 0.0])
+        self.checkpoint_section()
         if args or kwargs:
             self.play(*args, **kwargs)
 
+    def play(self, *args, **kwargs):
+        with profiler.play(', '.join(type(arg).__name__ for arg in args)):
+            if self.resume_movies:
+                self.play_from_checkpoint(*args, **kwargs)
+            else:
+                super().play(*args, **kwargs)
+        self.sections[-1][1] += self.duration or 0
+        self.scene_time += self.duration or 0
+        if not self.padding:
+            self.block_durations[-1] += (self.duration or 0) / self.time_scale
+
+    def compile_animations(self, *args, **kwargs):
+        animations = super().compile_animations(*args, **kwargs)
+        if self.time_scale != 1 and not self.padding:
+            for animation in animations:
+                animation.run_time *= self.time_scale
+                if isinstance(animation, Wait):
+                    animation.duration *= self.time_scale
+        return animations
+
+    def align_to_narration(self, block):
+        # Waits until the narration reaches this block, then speeds up the block if it ran longer than its narration
+        # last time. Blocks are only ever sped up; one that is too short is padded by the wait before the next.
+        if self.narration_starts is None:
+            return
+        self.time_scale = 1
+        if block < len(self.narration_starts):
+            start = self.narration_starts[block]
+            if self.scene_time < start - 1 / config.frame_rate:
+                self.padding = True
+                self.wait(start - self.scene_time)
+                self.padding = False
+            elif self.scene_time > start + 1 / config.frame_rate:
+                logger.warning(f'{type(self).__name__}: script block {block} starts {self.scene_time - start:.2f}s after its narration')
+            end = self.narration_starts[block + 1] if block + 1 < len(self.narration_starts) else self.narration_duration
+            # block_durations[0] is before the first script()
+            if block + 1 < len(self.last_block_durations) and self.last_block_durations[block + 1] > end - start > 0:
+                self.time_scale = (end - start) / self.last_block_durations[block + 1]
+        self.block_durations.append(0.0)
+
+    def start_narration(self):
+        timing = narration_timing(self.narration, self.narration_manifest, self.narration_gap)
+        self.narration_starts = timing['starts']
+        self.narration_duration = timing['duration']
+        plan = os.environ.get('MANIMCODER_SEGMENT_PLAN')
+        if plan: # a segment scales its blocks with the durations the plan pass used, not the ones it saved after
+            with open(plan) as f:
+                self.last_block_durations = json.load(f).get('block_durations', [])
+        elif os.path.exists(self.narration_timing_path()):
+            with open(self.narration_timing_path()) as f:
+                self.last_block_durations = json.load(f)
+        if not config.from_animation_number and not config.upto_animation_number:
+            self.add_sound(self.narration) # segments are joined with the narration instead, see manimcoder.render
+
+    def narration_timing_path(self):
+        return os.path.join(narration_directory(), type(self).__name__ + '.blocks.json')
+
+    def play_from_checkpoint(self, *args, **kwargs):
+        # Runs the animations straight to their end state, and reuses the movie file of the last render
+        renderer = self.renderer
+        skipping = renderer._original_skipping_status
+        renderer._original_skipping_status = True
+        try:
+            super().play(*args, **kwargs)
+        finally:
+            renderer._original_skipping_status = skipping
+        renderer.file_writer.partial_movie_files[-1] = self.resume_movies.popleft()
+
+    def checkpoint_state(self):
+        # What the next section starts from, beyond the code that got it here
+        return [
+            mobject.checkpoint_state() if hasattr(mobject, 'checkpoint_state') else
+            (type(mobject).__name__, mobject.get_center().round(3).tolist())
+            for mobject in self.mobjects
+        ]
+
+    def checkpoint_section(self):
+        if self.checkpoints is None:
+            return
+        self.end_resume()
+        self.checkpoints.end_section(self.renderer.file_writer.partial_movie_files)
+        # the narration decides how the section is scaled and padded, so a new recording invalidates it
+        state = self.checkpoint_state() + [self.time_scale, self.narration_starts, self.narration_duration]
+        resume = self.checkpoints.reached(self.renderer.num_plays, self.renderer.time, state)
+        if resume:
+            checkpoint, self.resume_until = resume
+            self.resume_movies.extend(checkpoint['movies'])
+
+    def end_resume(self):
+        if self.resume_until is not None:
+            self.renderer.time = self.resume_until['time'] # skipped animations do not add their run time
+            self.resume_until = None
+        self.resume_movies.clear()
+
+    def compile_animation_data(self, *args, **kwargs):
+        compiled = super().compile_animation_data(*args, **kwargs)
+        file_writer = self.renderer.file_writer
+        if isinstance(file_writer, ScriptSceneFileWriter):
+            skipping = self.renderer.skip_animations or config.disable_caching
+            file_writer.cache_key = None if skipping else play_cache_key(self)
+        return compiled
+
+    def update_to_time(self, t):
+        with profiler.phase('interpolation'):
+            super().update_to_time(t)
+
+    def update_mobjects(self, dt):
+        with profiler.phase('updaters'):
+            super().update_mobjects(dt)
+
     def render(self, *args, **kwargs):
-        render = super().render(*args, **kwargs)
+        if self.narration:
+            self.start_narration()
+        if self.checkpoint and config.write_to_movie and not config.disable_caching \
+                and not config.from_animation_number and not config.upto_animation_number:
+            path = os.path.join(self.renderer.file_writer.partial_movie_directory, 'checkpoints.json')
+            self.checkpoints = SceneCheckpoints(type(self), path)
+        if self.profile:
+            file_writer = self.renderer.file_writer
+            file_writer.write_frame = profiler.timed('encode', file_writer.write_frame)
+            profiler.start()
+        try:
+            render = super().render(*args, **kwargs)
+        finally:
+            profiler.stop()
+        if self.checkpoints is not None:
+            self.end_resume()
+            self.checkpoints.finish(
+                self.renderer.num_plays, self.renderer.time, self.checkpoint_state(),
+                self.renderer.file_writer.partial_movie_files
+            )
         print('\n\n'.join(['='*20] + self.script_lines + ['='*20]))
+        if self.profile:
+            self.report_profile()
+        if not config.from_animation_number and not config.upto_animation_number:
+            self.save_segment_plan()
+            if self.narration:
+                with open(self.narration_timing_path(), 'w') as f:
+                    json.dump(self.block_durations, f)
         return render
+
+    def save_segment_plan(self):
+        # Where the scene can be split to render in parallel, see manimcoder.render --segments
+        path = os.path.join(config.media_dir, 'segments', type(self).__name__ + '.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({
+                'plays': self.renderer.num_plays, 'sections': self.sections, 'narration': self.narration,
+                'block_durations': self.last_block_durations,
+            }, f)
+
+    def report_profile(self):
+        name = type(self).__name__
+        path = os.path.join(config.media_dir, 'profiles', name + '.json')
+        profiler.save(path, scene=name, glyph_cache=glyph_cache.stats())
+        print(f"Profile of {name} (seconds):")
+        print(profiler.table())
+        print(f"Profile saved to {path}")
@@ -0,0 +1,131 @@
+from manim import *
+from pygments.styles import get_style_by_name
+from pygments.token import STANDARD_TYPES
+import hashlib
+
+STANDARD_TYPES_BY_CLASS = {cls: ttype for ttype, cls in STANDARD_TYPES.items()}
+DEFAULT_COLOR = '#FFFFFF'
+
+
+class Theme:
+    def __init__(self, name, styles):
+        self.name = name
+        self.styles = dict(styles)
+        self.lookup = dict(self.styles)
+        self._digest = None
+
+    def style(self, ttype):
+        # (color, weight, slant) for a token type, types without a style of their own take their parent's
+        if ttype not in self.lookup:
+            parent = ttype.parent
+            self.lookup[ttype] = None if parent is None else self.style(parent)
+        return self.lookup[ttype]
+
+    def digest(self):
+        # A hash of every style, for keying what was rendered with the theme
+        if self._digest is None:
+            self._digest = hashlib.sha256(repr(sorted(self.styles.items())).encode()).hexdigest()
+        return self._digest
+
+    @classmethod
+    def from_pygments(cls, name):
+        styles = {}
+        for ttype, spec in get_style_by_name(name):
+            color = spec['color']
+            styles[ttype] = (
+                '#' + color if color and not color.startswith('ansi') else DEFAULT_COLOR,
+                BOLD if spec['bold'] else NORMAL,
+                ITALIC if spec['italic'] else NORMAL,
+            )
+        return cls(name, styles)
+
+
+THEMES = {}
+
+
+def register_theme(theme):
+    THEMES[theme.name] = theme
+    return theme
+
+
+def get_theme(name):
+    # Compiled once per name, then shared by every HighlightedCode using it
+    if isinstance(name, Theme):
+        return name
+    if name not in THEMES:
+        register_theme(Theme.from_pygments(name))
+    return THEMES[name]
+
+
+# The colours manimcoder used before styles were honoured: pygments 'default', with names and punctuation kept white
+# for the dark background.
+register_theme(Theme('manimcoder', {STANDARD_TYPES_BY_CLASS[cls]: style for cls, style in {
+    'n': ('#FFFFFF', NORMAL, NORMAL),  # ???
+    'p': ('#FFFFFF', NORMAL, NORMAL),  # ???
+    'c': ('#408080', NORMAL, ITALIC),  # Comment
+    'k': ('#008000', BOLD, NORMAL),  # Keyword
+    'o': ('#666666', NORMAL, NORMAL),  # Operator
+    'ch': ('#408080', NORMAL, ITALIC),  # Comment.Hashbang
+    'cm': ('#408080', NORMAL, ITALIC),  # Comment.Multiline
+    'cp': ('#BC7A00', NORMAL, NORMAL),  # Comment.Preproc
+    'cpf': ('#408080', NORMAL, ITALIC),  # Comment.PreprocFile
+    'c1': ('#408080', NORMAL, ITALIC),  # Comment.Single
+    'cs': ('#408080', NORMAL, ITALIC),  # Comment.Special
+    'gd': ('#A00000', NORMAL, NORMAL),  # Generic.Deleted
+    'ge': ('#FFFFFF', NORMAL, ITALIC),  # Generic.Emph
+    'gr': ('#FF0000', NORMAL, NORMAL),  # Generic.Error
+    'gh': ('#000080', BOLD, NORMAL),  # Generic.Heading
+    'gi': ('#00A000', NORMAL, NORMAL),  # Generic.Inserted
+    'go': ('#888888', NORMAL, NORMAL),  # Generic.Output
+    'gp': ('#000080', BOLD, NORMAL),  # Generic.Prompt
+    'gs': ('#FFFFFF', BOLD, NORMAL),  # Generic.Strong
+    'gu': ('#800080', BOLD, NORMAL),  # Generic.Subheading
+    'gt': ('#0044DD', NORMAL, NORMAL),  # Generic.Traceback
+    'kc': ('#008000', BOLD, NORMAL),  # Keyword.Constant
+    'kd': ('#008000', BOLD, NORMAL),  # Keyword.Declaration
+    'kn': ('#008000', BOLD, NORMAL),  # Keyword.Namespace
+    'kp': ('#008000', NORMAL, NORMAL),  # Keyword.Pseudo
+    'kr': ('#008000', BOLD, NORMAL),  # Keyword.Reserved
+    'kt': ('#B00040', NORMAL, NORMAL),  # Keyword.Type
+    'm': ('#666666', NORMAL, NORMAL),  # Literal.Number
+    's': ('#BA2121', NORMAL, NORMAL),  # Literal.String
+    'na': ('#7D9029', NORMAL, NORMAL),  # Name.Attribute
+    'nb': ('#008000', NORMAL, NORMAL),  # Name.Builtin
+    'nc': ('#4444FF', BOLD, NORMAL),  # Name.Class
+    'no': ('#880000', NORMAL, NORMAL),  # Name.Constant
+    'nd': ('#AA22FF', NORMAL, NORMAL),  # Name.Decorator
+    'ni': ('#999999', BOLD, NORMAL),  # Name.Entity
+    'ne': ('#D2413A', BOLD, NORMAL),  # Name.Exception
+    'nf': ('#4444FF', NORMAL, NORMAL),  # Name.Function
+    'nl': ('#A0A000', NORMAL, NORMAL),  # Name.Label
+    'nn': ('#4444FF', BOLD, NORMAL),  # Name.Namespace
+    'nt': ('#008000', BOLD, NORMAL),  # Name.Tag
+    'nv': ('#19177C', NORMAL, NORMAL),  # Name.Variable
+    'ow': ('#AA22FF', BOLD, NORMAL),  # Operator.Word
+    'w': ('#bbbbbb', NORMAL, NORMAL),  # Text.Whitespace
+    'mb': ('#666666', NORMAL, NORMAL),  # Literal.Number.Bin
+    'mf': ('#666666', NORMAL, NORMAL),  # Literal.Number.Float
+    'mh': ('#666666', NORMAL, NORMAL),  # Literal.Number.Hex
+    'mi': ('#666666', NORMAL, NORMAL),  # Literal.Number.Integer
+    'mo': ('#666666', NORMAL, NORMAL),  # Literal.Number.Oct
+    'sa': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Affix
+    'sb': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Backtick
+    'sc': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Char
+    'dl': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Delimiter
+    'sd': ('#BA2121', NORMAL, ITALIC),  # Literal.String.Doc
+    's2': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Double
+    'se': ('#BB6622', BOLD, NORMAL),  # Literal.String.Escape
+    'sh': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Heredoc
+    'si': ('#BB6688', BOLD, NORMAL),  # Literal.String.Interpol
+    'sx': ('#008000', NORMAL, NORMAL),  # Literal.String.Other
+    'sr': ('#BB6688', NORMAL, NORMAL),  # Literal.String.Regex
+    's1': ('#BA2121', NORMAL, NORMAL),  # Literal.String.Single
+    'ss': ('#19177C', NORMAL, NORMAL),  # Literal.String.Symbol
+    'bp': ('#008000', NORMAL, NORMAL),  # Name.Builtin.Pseudo
+    'fm': ('#4444FF', NORMAL, NORMAL),  # Name.Function.Magic
+    'vc': ('#19177C', NORMAL, NORMAL),  # Name.Variable.Class
+    'vg': ('#19177C', NORMAL, NORMAL),  # Name.Variable.Global
+    'vi': ('#19177C', NORMAL, NORMAL),  # Name.Variable.Instance
+    'vm': ('#19177C', NORMAL, NORMAL),  # Name.Variable.Magic
+    'il': ('#666666', NORMAL, NORMAL),  # Literal.Number.Integer.Long
+}.items()}))
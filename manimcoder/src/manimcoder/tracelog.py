@@ -0,0 +1,109 @@
+from enum import Enum
+from collections import namedtuple
+from array import array
+import struct
+
+TRACE_MAGIC = b'MCTRACE1'
+STRING_RECORD = 255
+# kind, step, line, depth, name, value. A STRING_RECORD uses the step field for the length of the utf-8 text after it.
+RECORD = struct.Struct('<BIiHII')
+
+
+class TraceEvents(Enum):
+    LINE = 0
+    CALL = 1
+    RETURN = 2
+    SET = 3
+    DELETE = 4
+    OUTPUT = 5
+
+
+KINDS = list(TraceEvents)
+
+# line is 0 based, to match ProgramCode. depth is 0 for the module, 1 for the first function called and so on.
+TraceEvent = namedtuple('TraceEvent', ['step', 'kind', 'line', 'depth', 'name', 'value'])
+
+
+class TraceLog:
+    # Column per field, with names and values interned, so a long trace costs a few bytes per event
+    def __init__(self):
+        self.steps = array('I')
+        self.kinds = array('B')
+        self.lines = array('i')
+        self.depths = array('H')
+        self.names = array('I')
+        self.values = array('I')
+        self.strings = []
+        self.string_index = {}
+
+    def intern(self, text):
+        if text not in self.string_index:
+            self.string_index[text] = len(self.strings)
+            self.strings.append(text)
+        return self.string_index[text]
+
+    def append(self, step, kind, line, depth, name='', value=''):
+        self.steps.append(step)
+        self.kinds.append(kind.value)
+        self.lines.append(-1 if line is None else line)
+        self.depths.append(depth)
+        self.names.append(self.intern(name))
+        self.values.append(self.intern(value))
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __getitem__(self, i):
+        line = self.lines[i]
+        return TraceEvent(
+            self.steps[i], KINDS[self.kinds[i]], None if line == -1 else line, self.depths[i],
+            self.strings[self.names[i]], self.strings[self.values[i]],
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def save(self, path):
+        # Strings are written just before the first event using them, so the file can be read back as a stream
+        written = 0
+        with open(path, 'wb') as f:
+            f.write(TRACE_MAGIC)
+            for i in range(len(self)):
+                name, value = self.names[i], self.values[i]
+                while written <= max(name, value):
+                    text = self.strings[written].encode()
+                    f.write(RECORD.pack(STRING_RECORD, len(text), 0, 0, 0, 0))
+                    f.write(text)
+                    written += 1
+                f.write(RECORD.pack(self.kinds[i], self.steps[i], self.lines[i], self.depths[i], name, value))
+
+    @classmethod
+    def load(cls, path):
+        log = cls()
+        for event in read_trace(path):
+            log.append(*event)
+        return log
+
+
+def read_trace(path, kinds=None, every=1):
+    # Streams the events of a saved trace. kinds limits which events are returned. every=n keeps only one LINE event in
+    # n, down-sampling run arrow moves without losing any change of state.
+    strings = []
+    with open(path, 'rb') as f:
+        if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+            raise ValueError(f'{path} is not a saved program trace.')
+        while True:
+            record = f.read(RECORD.size)
+            if not record:
+                return
+            kind, step, line, depth, name, value = RECORD.unpack(record)
+            if kind == STRING_RECORD:
+                strings.append(f.read(step).decode())
+                continue
+            kind = KINDS[kind]
+            if kinds is not None and kind not in kinds:
+                continue
+            if kind is TraceEvents.LINE and step % every:
+                continue
+            yield TraceEvent(step, kind, None if line == -1 else line, depth, strings[name], strings[value])
@@ -0,0 +1,189 @@
+from manim import *
+from manimcoder.atomicfile import atomic_path
+from manimcoder.tracelog import TraceLog, TraceEvents, TraceEvent, read_trace
+from contextlib import redirect_stdout
+from types import FunctionType, ModuleType
+import builtins
+import hashlib
+import os
+import sys
+
+PROGRAM_FILENAME = '<program>'
+# Bumped whenever what a trace records changes. Line events also differ between Python versions, so both key saved traces.
+TRACE_FORMAT = 2
+MAX_VALUE_LENGTH = 40 # longer values are cut short, the vars panel has no room for them
+
+
+def format_value(value):
+    if isinstance(value, FunctionType):
+        return '<func>'
+    if isinstance(value, type):
+        return '<class>'
+    if isinstance(value, ModuleType):
+        return '<module>'
+    text = repr(value)
+    if len(text) > MAX_VALUE_LENGTH:
+        return text[:MAX_VALUE_LENGTH - 3] + '...'
+    return text
+
+
+class TraceOutput:
+    # stdout replacement turning printed text into an OUTPUT event per line
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self.buffer = ''
+
+    def write(self, text):
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split('\n')
+        for line in lines:
+            self.tracer.record_output(line)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class ProgramTracer:
+    def __init__(self, code, max_steps=100000):
+        self.code = code
+        self.max_steps = max_steps
+        self.events = TraceLog()
+        self.frames = {} # traced frame -> [depth, {name: formatted value}, line it is on]
+        self.step = 0
+        self.line = None
+        self.depth = 0
+
+    def record(self, kind, name='', value=''):
+        # self.line and self.depth are those of the frame the event comes from
+        self.events.append(self.step, kind, self.line, self.depth, name, value)
+
+    def enter_frame(self, frame):
+        # Records events from the innermost traced frame from frame outwards, e.g. the one calling print()
+        while frame is not None and frame not in self.frames:
+            frame = frame.f_back
+        if frame is not None:
+            self.depth, _, self.line = self.frames[frame]
+
+    def record_output(self, text):
+        # print() runs with no trace event of its own
+        self.enter_frame(sys._getframe())
+        self.record(TraceEvents.OUTPUT, value=text)
+
+    def run(self):
+        program = compile(self.code, PROGRAM_FILENAME, 'exec')
+        output = TraceOutput(self)
+        namespace = {'__name__': '__main__', '__builtins__': builtins}
+        previous_trace = sys.gettrace() # a debugger or coverage, restored afterwards
+        sys.settrace(self._trace_call)
+        try:
+            with redirect_stdout(output):
+                exec(program, namespace)
+        except Exception as e:
+            output.write(f'{type(e).__name__}: {e}\n')
+        finally:
+            sys.settrace(previous_trace)
+        if output.buffer:
+            output.write('\n')
+        return self.events
+
+    def _trace_call(self, frame, event, arg):
+        if frame.f_code.co_filename != PROGRAM_FILENAME:
+            return None
+        depth = len(self.frames)
+        if depth:
+            self.enter_frame(frame.f_back) # the call is made from the caller's line
+            self.record(TraceEvents.CALL, name=frame.f_code.co_name)
+        self.frames[frame] = [depth, {}, frame.f_lineno - 1]
+        return self._trace_frame
+
+    def _trace_frame(self, frame, event, arg):
+        entry = self.frames[frame]
+        self.depth, known, self.line = entry
+        self._record_variables(frame, known)
+        if event == 'line':
+            self.step += 1
+            if self.step > self.max_steps:
+                raise RuntimeError(f'Program ran for more than max_steps={self.max_steps} lines.')
+            entry[2] = self.line = frame.f_lineno - 1
+            self.record(TraceEvents.LINE)
+        elif event == 'return':
+            del self.frames[frame]
+            if self.depth:
+                self.record(TraceEvents.RETURN, name=frame.f_code.co_name, value=format_value(arg))
+        return self._trace_frame
+
+    def _record_variables(self, frame, known):
+        # Changes made by the line that just ran. Values are compared formatted, so mutating a list shows as a change.
+        current = {
+            name: format_value(value) for name, value in frame.f_locals.items()
+            if not (name.startswith('__') and name.endswith('__'))
+        }
+        for name in [name for name in known if name not in current]:
+            del known[name]
+            self.record(TraceEvents.DELETE, name=name)
+        for name, value in current.items():
+            if known.get(name) != value:
+                known[name] = value
+                self.record(TraceEvents.SET, name=name, value=value)
+
+
+def trace_program(code, directory=None):
+    # Traces are saved under media/traces keyed by the program, so re-renders do not run the program again
+    directory = directory or os.path.join(config.media_dir, 'traces')
+    key = repr((TRACE_FORMAT, tuple(sys.version_info[:3]), code))
+    path = os.path.join(directory, hashlib.sha256(key.encode()).hexdigest()[:16] + '.trace')
+    if os.path.exists(path):
+        return TraceLog.load(path)
+    events = ProgramTracer(code).run()
+    os.makedirs(directory, exist_ok=True)
+    with atomic_path(path) as temp:
+        events.save(temp)
+    return events
+
+
+def replay_trace(display, events, quiet_lines=False):
+    # Yields one animation per visible step of a recorded run. Lines that change nothing on screen but the run arrow
+    # are skipped unless quiet_lines is set, so long loops do not turn into thousands of plays.
+    if not isinstance(events, TraceLog):
+        events = list(events)
+    names = [event.name for event in events if event.kind is TraceEvents.SET]
+    display.vars.var_length = max([display.vars.var_length] + [len(name) for name in names])
+    line, effects = None, []
+    for event in events:
+        # a new line starts a step, as does an event from another line, e.g. the caller's once a call returns
+        if event.kind is TraceEvents.LINE or event.line != line:
+            if line is not None and (effects or quiet_lines):
+                yield replay_step(display, line, effects)
+                effects = []
+            line = event.line
+        if event.kind is not TraceEvents.LINE:
+            effects.append(event)
+    if line is not None:
+        yield replay_step(display, line, effects)
+    display.code.update_runarrow(None)
+    yield display.code.runarrow()
+
+
+def replay_step(display, line, effects):
+    display.code.update_runarrow(line)
+    changed = {} # panels to animate, in the order they were first touched
+    for event in effects:
+        if event.kind is TraceEvents.CALL:
+            display.vars.add_scope(event.name)
+            display.stack.push_frame(event.name)
+            changed.update({display.vars: True, display.stack: True})
+        elif event.kind is TraceEvents.RETURN:
+            display.vars.remove_scope()
+            display.stack.pop_frame()
+            changed.update({display.vars: True, display.stack: True})
+        elif event.kind is TraceEvents.SET:
+            display.vars.set_var(event.name, event.value, scope=display.vars.frames[event.depth])
+            changed[display.vars] = True
+        elif event.kind is TraceEvents.DELETE:
+            display.vars.remove_var(event.name, scope=display.vars.frames[event.depth])
+            changed[display.vars] = True
+        elif event.kind is TraceEvents.OUTPUT:
+            display.output.add_line(event.value)
+            changed[display.output] = True
+    return AnimationGroup(display.code.runarrow(), *[panel.changes() for panel in changed])
@@ -0,0 +1,201 @@
+from manim import *
+from manimcoder import *
+from manimcoder.codedisplay import VarsPanel, OutputPanel
+from manimcoder.programcode import ProgramCodeLines
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+# Headless benchmarks of manimcoder operations. Nothing is rendered or encoded, so these time only our own code (and
+# Pango, for highlighting). Results are saved per commit, e.g.
+#   python testing/benchmark.py
+#   python testing/benchmark.py --compare 1a2b3c4
+
+RESULTS_DIR = os.path.join('media', 'benchmarks')
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    # Registers a function that sets a benchmark up and returns the callable to be timed
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+def listing(lines):
+    block = ['def f(a, b):', '    total = a + b', '    print("total", total)', '    return total * 2', '']
+    return '\n'.join(block[i % len(block)] for i in range(lines))
+
+
+for lines in [1, 10, 100, 1000]:
+    @benchmark(f'highlight_{lines}_lines')
+    def highlight(lines=lines):
+        code = listing(lines)
+        return lambda: HighlightedCode(code, font=ProgramCode.font, lexer='python', style='zenburn')
+
+
+for incremental in [False, True]:
+    @benchmark('programcode_edits' + ('_incremental' if incremental else ''))
+    def programcode_edits(incremental=incremental):
+        glyph_cache.clear()
+        program = ProgramCode(listing(50), lexer='python', incremental=incremental)
+        program.changes()
+        def run():
+            for i in range(10):
+                program.code.lines[i].replace('total', 'sum')
+                program.changes()
+                program.insert_line(i, f'x{i} = {i}')
+                program.changes()
+                program.code.lines[i].insert(0, '# ')
+                program.changes()
+        return run
+
+
+@benchmark('programcode_code_lookups')
+def programcode_code_lookups():
+    code = ProgramCodeLines(listing(200))
+    def run():
+        for i in range(100):
+            code.lines[i].insert(0, '#')
+            for _ in range(10): # highlighting, line lengths and panel queries all read the code between edits
+                code.get_new_code()
+                code.get_new_code(True)
+    return run
+
+
+@benchmark('programcode_symbol_lookups')
+def programcode_symbol_lookups():
+    program = ProgramCode(listing(50), lexer='python')
+    program.changes()
+    def run():
+        for line in program.code.lines:
+            for _ in range(20): # what a highlight box asks for on every step
+                line.symbols_range(4, -2)
+                line.symbols_by_search_all('total')
+    return run
+
+
+for count in [5, 20, 50]:
+    @benchmark(f'vars_set_var_{count}')
+    def vars_set_var(count=count):
+        glyph_cache.clear()
+        panel = VarsPanel()
+        panel.var_length = 4
+        def run():
+            for i in range(count):
+                panel.set_var(f'v{i}', str(i))
+                panel.changes()
+            for i in range(count):
+                panel.set_var(f'v{i}', str(i * 2))
+            panel.changes()
+        return run
+
+
+@benchmark('output_add_line_stream')
+def output_add_line_stream():
+    glyph_cache.clear()
+    panel = OutputPanel()
+    def run():
+        for i in range(100):
+            panel.add_line(f'line {i}')
+            panel.changes()
+    return run
+
+
+@benchmark('set_panels_toggle')
+def set_panels_toggle():
+    program = CodeDisplay()
+    program.code.content.replace_code(listing(50))
+    program.code.content.changes()
+    def run():
+        for i in range(20):
+            program.set_panels(PANEL_CODE + PANEL_VARS + PANEL_TRACE + PANEL_OUTPUT if i % 2 else PANEL_CODE)
+    return run
+
+
+@benchmark('transition_panels')
+def transition_panels():
+    program = CodeDisplay()
+    program.code.content.replace_code(listing(50))
+    program.code.content.changes()
+    def run():
+        for panels in [PANEL_CODE + PANEL_VARS + PANEL_OUTPUT, PANEL_CODE]:
+            transition = program.transition_panels(panels)
+            transition.begin()
+            for frame in range(30):
+                transition.interpolate(frame / 29)
+            transition.finish()
+    return run
+
+
+def run_benchmark(setup, repeat):
+    times = []
+    for _ in range(repeat):
+        run = setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'repeat': repeat}
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD', '--', 'manimcoder'])
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+def load_results(name):
+    path = name if os.path.exists(name) else os.path.join(RESULTS_DIR, name + '.json')
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current):
+    print(f"{'benchmark':32} {baseline['commit']:>14} {current['commit']:>14}  change")
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            print(f"{name:32} {'-':>14} {result['min']:14.4f}")
+            continue
+        before = baseline['results'][name]['min']
+        print(f"{name:32} {before:14.4f} {result['min']:14.4f}  {(result['min'] - before) / before:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time manimcoder operations without rendering.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', action='append', help='run only benchmarks whose name starts with this')
+    parser.add_argument('--compare', help='commit or results file to compare against')
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if args.only and not any(name.startswith(prefix) for prefix in args.only):
+            continue
+        results[name] = run_benchmark(setup, args.repeat)
+        print(f"{name:32} min {results[name]['min']:.4f}s  median {results[name]['median']:.4f}s")
+
+    current = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'results': results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, current['commit'] + '.json')
+    with open(path, 'w') as f:
+        json.dump(current, f, indent=2)
+    print(f"Results saved to {path}")
+    if args.compare:
+        compare(load_results(args.compare), current)
+
+
+if __name__ == '__main__':
+    main()
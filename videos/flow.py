@@ -45,7 +45,7 @@ class ProgramFlow(Scene):
         self.play(program.code.content.changes(), self.highlight())
         program.code.content.replace(0, '0', 'i')
 
-        self.play(ApplyMethod(program.set_panels, PANEL_CODE+PANEL_VARS))
+        self.play(program.transition_panels(PANEL_CODE+PANEL_VARS))
 
         self.play(ApplyMethod(program.vars.set_var, 'i', '0'))
 
@@ -70,7 +70,7 @@ class ProgramFlow(Scene):
         self.update_highlight(program.code.content.code.lines[1].symbols)
         self.play(self.highlight())
 
-        self.play(ApplyMethod(program.set_panels, PANEL_CODE+PANEL_VARS+PANEL_OUTPUT))
+        self.play(program.transition_panels(PANEL_CODE+PANEL_VARS+PANEL_OUTPUT))
 
         self.update_highlight(program.code.content.code.lines[1].symbols)
         self.play(self.highlight())
@@ -91,7 +91,7 @@ class ProgramFlow(ScriptScene):
         This behaves just as you might expect. Python will process each print statement in turn, and our output shows one two and three.
         """)
         self.wait(5)
-        self.play(ApplyMethod(program.set_panels, PANEL_CODE+PANEL_OUTPUT))
+        self.play(program.transition_panels(PANEL_CODE+PANEL_OUTPUT))
         program.code.update_runarrow(0)
         self.play(program.code.runarrow())
         program.output.add_line('one')
@@ -202,7 +202,7 @@ class FunctionDefinition(ScriptScene):
         self.play(cc)
 
         self.wait(1)
-        self.play(Uncreate(code), Uncreate(code.all_text))
+        self.play(Uncreate(code))
         self.script("""
         Now lets look at a simple real world example.
         """)
@@ -449,7 +449,7 @@ class FunctionArguments(ScriptScene):
         Similarly, we store the string "long" in our variety variable
         """)
         self.wait(27)
-        self.play(ApplyMethod(program.set_panels, PANEL_CODE+PANEL_VARS))
+        self.play(program.transition_panels(PANEL_CODE+PANEL_VARS))
 
         self.wait(13)
         program.vars.set_var('t_av', ' 24.5')
@@ -569,7 +569,7 @@ class SpecialCases(ScriptScene):
         cc = program.code.content.changes()
         program.code.update_runarrow(1)
         self.play(cc, program.vars.changes(), program.code.runarrow())
-        self.play(ApplyMethod(program.set_panels, PANEL_CODE+PANEL_VARS+PANEL_OUTPUT))
+        self.play(program.transition_panels(PANEL_CODE+PANEL_VARS+PANEL_OUTPUT))
         program.output.add_line("UnboundLocalError: local variable 'x'")
         program.output.add_line("referenced before assignment")
         self.play(program.output.content.changes())
@@ -658,7 +658,7 @@ class SpecialCases(ScriptScene):
         """)
         self.wait(10)
         program2.vars.var_length = 3
-        self.play(ApplyMethod(program.set_panels, PANEL_CODE+PANEL_VARS))
+        self.play(program.transition_panels(PANEL_CODE+PANEL_VARS))
 
         self.wait(10)
         program.vars.set_var('x', '[]')
@@ -679,7 +679,7 @@ class SpecialCases(ScriptScene):
         Thus, when the function returns, and the print is executed, we see that the list has been modified.
         """)
         self.wait(10)
-        self.play(ApplyMethod(program.set_panels, PANEL_CODE+PANEL_VARS+PANEL_OUTPUT))
+        self.play(program.transition_panels(PANEL_CODE+PANEL_VARS+PANEL_OUTPUT))
 
         self.wait(10)
         program.output.add_line('[1]')
@@ -835,7 +835,7 @@ class BestPractices(ScriptScene):
             "G_ACC = 9.8",
         ]))
         program.output.clear_lines()
-        self.play(ApplyMethod(program.set_panels, PANEL_CODE), program.code.content.changes(), program.output.content.changes())
+        self.play(program.transition_panels(PANEL_CODE), program.code.content.changes(), program.output.content.changes())
         self.script("""
         This makes programs easier to understand, and easier to debug.
         
@@ -858,7 +858,7 @@ class BestPractices(ScriptScene):
             "print(x)",
         ]))
         program.output.add_line("[2, 4, 6, 8]")
-        self.play(ApplyMethod(program.set_panels, PANEL_CODE+PANEL_OUTPUT), program.code.content.changes(), program.output.content.changes())
+        self.play(program.transition_panels(PANEL_CODE+PANEL_OUTPUT), program.code.content.changes(), program.output.content.changes())
 
         self.wait(5)
         self.play(Uncreate(program))